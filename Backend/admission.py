@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Admission control, applied before any request reaches the database:
+#   * token buckets per client IP, per endpoint and per username
+#   * a global cap on in-flight requests, so overload is rejected early
+#     instead of slowing every request down together.
+#
+# A bucket store only needs take(key, rate, burst); LocalBucketStore keeps the
+# buckets in this process.
+
+
+class LocalBucketStore:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        # Returns (allowed, seconds until enough tokens are back)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+
+            if tokens >= cost:
+                allowed, retry_after = True, 0.0
+                tokens -= cost
+            else:
+                allowed, retry_after = False, (cost - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # Idle buckets are full anyway, so forgetting the oldest loses nothing
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+class RateLimiter:
+    def __init__(self, store):
+        self.store = store
+        self.rejected = {}
+
+    def check(self, scope, key, rate, burst):
+        if rate <= 0:
+            return True, 0.0
+        allowed, retry_after = self.store.take(f"{scope}:{key}", rate, burst)
+        if not allowed:
+            self.rejected[scope] = self.rejected.get(scope, 0) + 1
+        return allowed, retry_after
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.peak = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+def parse_limit(value):
+    # "rate/burst" in requests per second, e.g. "5/10"; "0" disables the limit
+    rate, _, burst = value.partition("/")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
+
+
+def retry_after_header(seconds):
+    return str(max(1, int(seconds + 0.999)))
@@ -0,0 +1,272 @@
+import csv
+import json
+import threading
+import time
+
+from sqlalchemy import insert
+
+# Prefix and suffix blacklist rules ("scam*", "*@fakepsp") compiled into two
+# character tries, one over the ID and one over the ID reversed. A lookup walks
+# at most len(upi_id) nodes per trie, whatever the number of rules. Exact IDs
+# stay in the shared blacklist set; only pattern rules live here.
+#
+# Patterns are matched case-insensitively. Every worker keeps its own compiled
+# copy and rebuilds it when the shared version counter moves.
+#
+# Feeds are imported in batches: ImportBatch parses lines as they stream in and
+# insert_missing() writes each batch with one INSERT ... ON CONFLICT DO NOTHING,
+# so entries already on file are skipped without a lookup per ID. LineSplitter
+# cuts the upload into lines; one longer than MAX_LINE_BYTES cannot hold a
+# valid entry, so it is dropped as it streams instead of being buffered.
+
+MAX_ENTRY_LENGTH = 256
+MAX_LINE_BYTES = 4096
+KINDS = ("exact", "prefix", "suffix")
+HEADER_NAMES = {"upi_id", "value", "id", "pattern"}
+_END = ""   # Terminal marker; never a real character key
+
+
+def classify(value, kind=None):
+    # (kind, value) for one feed entry, or None if it cannot be used.
+    # Without an explicit kind: "*@psp" and "@psp" are suffixes, "handle*" a prefix.
+    value = (value or "").strip()
+    if not value or len(value) > MAX_ENTRY_LENGTH or any(c.isspace() for c in value):
+        return None
+    if kind:
+        kind = kind.strip().lower()
+        if kind not in KINDS:
+            return None
+        value = value.strip("*")
+    elif value.startswith("*") and value.endswith("*"):
+        return None
+    elif value.startswith("*"):
+        kind, value = "suffix", value[1:]
+    elif value.endswith("*"):
+        kind, value = "prefix", value[:-1]
+    elif value.startswith("@"):
+        kind = "suffix"
+    else:
+        kind = "exact"
+    if not value:
+        return None
+    return kind, (value if kind == "exact" else value.lower())
+
+
+def parse_line(line, fmt, default_reason):
+    # (kind, value, reason), "skip" for blank lines and headers, or None if invalid
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", "replace")
+    line = line.strip().lstrip("\ufeff")
+    if not line:
+        return "skip"
+
+    if fmt == "ndjson":
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        value = record.get("upi_id") or record.get("value") or record.get("pattern")
+        kind, reason = record.get("kind"), record.get("reason")
+    else:
+        cells = next(csv.reader([line]), [])
+        if not cells:
+            return "skip"
+        if cells[0].strip().lower() in HEADER_NAMES:
+            return "skip"
+        value = cells[0]
+        reason = cells[1] if len(cells) > 1 else None
+        kind = cells[2] if len(cells) > 2 else None
+
+    classified = classify(value if isinstance(value, str) else None, kind if isinstance(kind, str) else None)
+    if classified is None:
+        return None
+    reason = reason.strip() if isinstance(reason, str) and reason.strip() else default_reason
+    return classified[0], classified[1], reason[:MAX_ENTRY_LENGTH]
+
+
+class ImportBatch:
+    # Parsed entries of one feed, handed out `batch_size` at a time. With
+    # fmt="auto" the first non-blank line decides: "{" means NDJSON, else CSV.
+
+    def __init__(self, fmt, default_reason, batch_size):
+        self.fmt = None if fmt == "auto" else fmt
+        self.default_reason = default_reason
+        self.batch_size = batch_size
+        self.entries = []
+        self.lines = 0
+        self.invalid = 0
+
+    def feed(self, line):
+        # True once a full batch is waiting in `entries`; None is an oversized line
+        if line is None:
+            self.lines += 1
+            self.invalid += 1
+            return False
+        if self.fmt is None:
+            head = line.strip().lstrip(b"\xef\xbb\xbf" if isinstance(line, bytes) else "\ufeff")
+            if not head:
+                return False
+            self.fmt = "ndjson" if head[:1] in ("{", b"{") else "csv"
+        self.lines += 1
+        parsed = parse_line(line, self.fmt, self.default_reason)
+        if parsed is None:
+            self.invalid += 1
+        elif parsed != "skip":
+            self.entries.append(parsed)
+        return len(self.entries) >= self.batch_size
+
+    def take(self):
+        entries, self.entries = self.entries, []
+        return entries
+
+
+class LineSplitter:
+    # Lines of a byte stream fed in arbitrary chunks. The unfinished line is
+    # kept as a list of parts and joined once, when its newline arrives. A line
+    # past `max_bytes` stops being buffered and comes out as None.
+
+    def __init__(self, max_bytes=MAX_LINE_BYTES):
+        self.max_bytes = max_bytes
+        self._parts = []
+        self._size = 0
+        self._oversized = False
+
+    def feed(self, chunk):
+        lines = []
+        start = 0
+        end = chunk.find(b"\n")
+        while end >= 0:
+            self._append(chunk[start:end])
+            lines.append(self._take())
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        self._append(chunk[start:])
+        return lines
+
+    def finish(self):
+        # The last line when the stream does not end with a newline
+        return [self._take()] if self._parts or self._oversized else []
+
+    def _append(self, part):
+        if self._oversized or not part:
+            return
+        self._size += len(part)
+        if self._size > self.max_bytes:
+            self._oversized = True
+            self._parts = []
+        else:
+            self._parts.append(part)
+
+    def _take(self):
+        line = None if self._oversized else b"".join(self._parts)
+        self._parts, self._size, self._oversized = [], 0, False
+        return line
+
+
+def insert_missing(connection, table, rows, key_columns):
+    # INSERT ... ON CONFLICT DO NOTHING; returns the keys that were new
+    if not rows:
+        return []
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        dialect_insert = None
+
+    keys = [table.c[name] for name in key_columns]
+    if dialect_insert is None:
+        # Portable fallback: look up the batch's keys, insert the rest
+        existing = set()
+        for start in range(0, len(rows), 500):
+            chunk = [tuple(row[name] for name in key_columns) for row in rows[start:start + 500]]
+            existing.update(tuple(r) for r in connection.execute(
+                table.select().with_only_columns(*keys).where(keys[0].in_([k[0] for k in chunk]))
+            ))
+        fresh = [row for row in rows if tuple(row[name] for name in key_columns) not in existing]
+        if fresh:
+            connection.execute(insert(table), fresh)
+        return [tuple(row[name] for name in key_columns) for row in fresh]
+
+    statement = dialect_insert(table).on_conflict_do_nothing(index_elements=keys).returning(*keys)
+    added = []
+    for start in range(0, len(rows), 1000):
+        added.extend(tuple(r) for r in connection.execute(statement, rows[start:start + 1000]))
+    return added
+
+
+class PatternMatcher:
+    def __init__(self, rules=()):
+        self._prefixes = {}
+        self._suffixes = {}
+        self.size = 0
+        for kind, pattern in rules:
+            self.add(kind, pattern)
+
+    def add(self, kind, pattern):
+        node = self._prefixes if kind == "prefix" else self._suffixes
+        for char in (pattern if kind == "prefix" else reversed(pattern)):
+            node = node.setdefault(char, {})
+        if _END not in node:
+            self.size += 1
+        node[_END] = pattern
+
+    def match(self, upi_id):
+        # The first rule covering upi_id as (kind, pattern), or None
+        value = upi_id.lower()
+        for kind, root, chars in (("prefix", self._prefixes, value), ("suffix", self._suffixes, reversed(value))):
+            node = root
+            for char in chars:
+                node = node.get(char)
+                if node is None:
+                    break
+                if _END in node:
+                    return kind, node[_END]
+        return None
+
+
+class CompiledPatterns:
+    # The current PatternMatcher, recompiled from `load()` whenever the version
+    # counter in the state backend changes. The counter is checked at most
+    # every `refresh_seconds`; a rebuild runs in the request that noticed it
+    # while other requests keep using the previous matcher. The worker that
+    # added the rules rebuilds with `wait=True`, so it never skips its own.
+
+    VERSION_KEY = "blacklist:patterns"
+
+    def __init__(self, backend, load, refresh_seconds=1.0):
+        self.backend = backend
+        self.load = load
+        self.refresh_seconds = refresh_seconds
+        self.matcher = PatternMatcher()
+        self.version = None
+        self.rebuilds = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def bump(self):
+        self.backend.incr(self.VERSION_KEY, 1)
+
+    def rebuild(self, wait=False):
+        # Without wait, a rebuild already running stands in for this one; it
+        # may have loaded before the caller's rules were committed, though
+        if not self._lock.acquire(blocking=wait):
+            return
+        try:
+            version = self.backend.get(self.VERSION_KEY)
+            self.matcher = PatternMatcher(self.load())
+            self.version = version
+            self.rebuilds += 1
+        finally:
+            self._lock.release()
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.refresh_seconds:
+            self._checked_at = now
+            if self.backend.get(self.VERSION_KEY) != self.version:
+                self.rebuild()
+        return self.matcher
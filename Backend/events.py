@@ -0,0 +1,104 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("guardpay")
+
+# In-process publish/subscribe for live admin data. Write paths publish small
+# dicts after their commit; nothing here touches the database.
+#
+# Each subscriber owns a bounded buffer. When a slow consumer lets it fill up,
+# the oldest events are dropped and counted, so a stuck browser tab can never
+# hold memory or slow down publishers. Synchronous listeners (for in-process
+# consumers such as aggregators) are called inline and must be cheap.
+
+
+class Subscription:
+    def __init__(self, bus, loop, buffer_size):
+        self._bus = bus
+        self._loop = loop
+        self._events = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self.dropped = 0
+
+    def _push(self, event):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+        # Publishers run in the threadpool; only the loop may touch the asyncio.Event
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass  # Loop already closed, the subscriber is going away
+
+    async def next_batch(self, timeout):
+        # Returns (events, dropped since last batch); empty on timeout
+        if not self._events:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup.clear()
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            dropped, self.dropped = self.dropped, 0
+        return events, dropped
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self, buffer_size=256):
+        self.buffer_size = buffer_size
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def subscribe(self, buffer_size=None):
+        subscription = Subscription(self, asyncio.get_running_loop(), buffer_size or self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def publish(self, kind, data):
+        event = {"id": next(self._ids), "type": kind, "ts": time.time(), **data}
+        self.published += 1
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                # A broken listener must never fail the write path that published
+                logger.exception("Event listener failed for %s", kind)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._push(event)
+
+    def stats(self):
+        return {"subscribers": len(self._subscribers), "published": self.published}
+
+
+def sse_message(kind, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {kind}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'), default=str)}")
+    return ("\n".join(lines) + "\n\n").encode()
@@ -0,0 +1,94 @@
+import threading
+from collections import deque
+
+# Approvals made on the trusted fast path, waiting for their follow-up work.
+#
+# A fast-path transfer is answered from cached state only (user_state, the
+# shared velocity counters and blacklist). Its audit log, snapshot and
+# fingerprint updates, and a re-run of the full risk rules, happen afterwards
+# in the background writer, in the order the approvals were made. When the
+# full rules would have blocked the transfer, the sender's Aura is clawed back
+# and the account gets a warning, which also keeps it off the fast path.
+#
+# Each approval is also an outbox row (fast_path_outbox), committed with the
+# stored answer and deleted in the commit that writes the audit log. Rows a
+# worker never settled, because it died or gave up, are picked up again by
+# recovery on any worker, so an answered approval is never lost.
+#
+# The queue is bounded: once it is full, transfers take the full path until
+# the writer catches up.
+
+
+class PendingApproval:
+    __slots__ = ("request", "sender", "idempotency_key", "threshold", "velocity", "epoch", "latency_ms", "attempts", "logged", "settled", "clawed_back")
+
+    def __init__(self, request, sender, idempotency_key, threshold, velocity, epoch, latency_ms):
+        self.request = request
+        self.sender = sender                    # UserState the approval was based on
+        self.idempotency_key = idempotency_key
+        self.threshold = threshold
+        self.velocity = velocity                # (approved, blocked) as seen at decision time
+        self.epoch = epoch
+        self.latency_ms = latency_ms
+        self.attempts = 0
+        self.logged = None                      # Set once the audit log is committed
+        self.settled = None                     # ... and the fingerprint updated after it
+        self.clawed_back = False
+
+
+class FastPathQueue:
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self.fast = 0             # Transfers approved on the fast path
+        self.full = 0             # Transfers decided by the full rules
+        self.verified = 0         # Fast approvals re-checked and written
+        self.disagreements = 0    # ... of which the full rules would have blocked
+        self.retries = 0
+        self.dropped = 0          # Gave up after repeated write failures (left to recovery)
+        self.recovered = 0        # Taken over from the outbox after a crash or give-up
+
+    def has_room(self):
+        return len(self._pending) < self.max_pending
+
+    def offer(self, approval):
+        # Called once the approval's outbox row is committed; if the queue
+        # filled up meanwhile, recovery settles it instead
+        with self._lock:
+            self.fast += 1
+            if len(self._pending) >= self.max_pending:
+                return False
+            self._pending.append(approval)
+            return True
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, deque()
+        return pending
+
+    def recover(self, approvals):
+        with self._lock:
+            self._pending.extend(approvals)
+            self.recovered += len(approvals)
+
+    def retry(self, approvals):
+        # Failed approvals go back in front, ahead of newer ones for the same users
+        with self._lock:
+            self._pending.extendleft(reversed(approvals))
+            self.retries += len(approvals)
+
+    def stats(self):
+        decisions = self.fast + self.full
+        return {
+            "pending": len(self._pending),
+            "fast": self.fast,
+            "full": self.full,
+            "fast_share": round(self.fast / decisions, 4) if decisions else 0.0,
+            "verified": self.verified,
+            "disagreements": self.disagreements,
+            "disagreement_rate": round(self.disagreements / self.verified, 4) if self.verified else 0.0,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "recovered": self.recovered,
+        }
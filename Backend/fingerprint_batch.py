@@ -0,0 +1,150 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import bindparam, column, create_engine, func, select, table, update
+from sqlalchemy.pool import NullPool
+
+# Recomputes every user's spending fingerprint (count, mean, population std
+# dev of APPROVED amounts) from transaction_logs in bulk.
+#
+# The id range is cut into chunks of `chunk_rows` ids. Each chunk is read by a
+# worker process and reduced with numpy group-bys to (count, mean, M2) per
+# user. The parent merges the partials with Chan's parallel-variance formula,
+# so memory is one chunk per worker plus three numbers per user, however many
+# logs there are.
+
+_worker_engine = None
+
+
+def _init_worker(database_url):
+    global _worker_engine
+    _worker_engine = create_engine(database_url, poolclass=NullPool)
+
+
+def _chunk_partials(job):
+    # (usernames, count, mean, m2) for the APPROVED rows with lo <= id < hi
+    table_name, approved, lo, hi = job
+    logs = table(table_name, column("id"), column("username"), column("amount"), column("state"))
+    query = select(logs.c.username, logs.c.amount).where(logs.c.id >= lo, logs.c.id < hi, logs.c.state == approved)
+    with _worker_engine.connect() as connection:
+        rows = connection.execute(query).all()
+    if not rows:
+        return [], np.empty(0, np.int64), np.empty(0), np.empty(0)
+
+    usernames = np.array([r[0] for r in rows], dtype=object)
+    amounts = np.array([r[1] or 0.0 for r in rows], dtype=np.float64)
+    names, codes = np.unique(usernames, return_inverse=True)
+    count = np.bincount(codes)
+    mean = np.bincount(codes, weights=amounts) / count
+    deviation = amounts - mean[codes]
+    m2 = np.bincount(codes, weights=deviation * deviation)
+    return names.tolist(), count, mean, m2
+
+
+class FingerprintAccumulator:
+    # Per-user (count, mean, M2), merged chunk by chunk with Chan's formula
+
+    def __init__(self, capacity=1024):
+        self.index = {}
+        self.count = np.zeros(capacity, np.int64)
+        self.mean = np.zeros(capacity)
+        self.m2 = np.zeros(capacity)
+
+    def _grow(self, size):
+        if size <= len(self.count):
+            return
+        capacity = max(size, 2 * len(self.count))
+        for name in ("count", "mean", "m2"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def merge(self, names, count, mean, m2):
+        if not names:
+            return
+        idx = np.fromiter((self.index.setdefault(name, len(self.index)) for name in names), np.int64, len(names))
+        self._grow(len(self.index))
+
+        n_a, n_b = self.count[idx], count
+        n = n_a + n_b
+        delta = mean - self.mean[idx]
+        self.mean[idx] += delta * n_b / n
+        self.m2[idx] += m2 + delta * delta * n_a * n_b / n
+        self.count[idx] = n
+
+    def rows(self):
+        size = len(self.index)
+        std_dev = np.sqrt(self.m2[:size] / np.maximum(self.count[:size], 1))
+        for name, i in self.index.items():
+            yield name, int(self.count[i]), float(self.mean[i]), float(self.m2[i]), float(std_dev[i])
+
+
+def recompute_fingerprints(engine, log_table, user_table, features_table, approved, workers=None, chunk_rows=200_000, batch_size=5000):
+    started = time.monotonic()
+    with engine.connect() as connection:
+        low, high = connection.execute(
+            select(func.min(log_table.c.id), func.max(log_table.c.id)).where(log_table.c.state == approved)
+        ).one()
+
+    accumulator = FingerprintAccumulator()
+    jobs = [] if low is None else [(log_table.name, approved.name, lo, lo + chunk_rows) for lo in range(low, high + 1, chunk_rows)]
+    database_url = engine.url.render_as_string(hide_password=False)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(jobs) <= 1:
+        _init_worker(database_url)
+        for partial in map(_chunk_partials, jobs):
+            accumulator.merge(*partial)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(database_url,)) as pool:
+            for partial in pool.map(_chunk_partials, jobs):
+                accumulator.merge(*partial)
+
+    # Write back in one transaction: users without approved logs are reset,
+    # the rest are updated in executemany batches keyed by username
+    now = datetime.now(timezone.utc)
+    set_user = update(user_table).where(user_table.c.username == bindparam("b_username")).values(
+        avg_tx_amount=bindparam("b_mean"), std_dev_amount=bindparam("b_std_dev"),
+        total_tx_count=bindparam("b_count"), last_fingerprint_update=now,
+    )
+    set_features = update(features_table).where(features_table.c.username == bindparam("b_username")).values(
+        approved_count=bindparam("b_count"), approved_mean=bindparam("b_mean"), approved_m2=bindparam("b_m2"),
+    )
+
+    updated = 0
+    with engine.begin() as connection:
+        connection.execute(
+            update(user_table).where(user_table.c.total_tx_count != 0).values(
+                avg_tx_amount=0.0, std_dev_amount=0.0, total_tx_count=0, last_fingerprint_update=now,
+            )
+        )
+        connection.execute(
+            update(features_table).where(features_table.c.approved_count != 0).values(
+                approved_count=0, approved_mean=0.0, approved_m2=0.0,
+            )
+        )
+
+        batch = []
+        for name, count, mean, m2, std_dev in accumulator.rows():
+            batch.append({"b_username": name, "b_count": count, "b_mean": mean, "b_m2": m2, "b_std_dev": std_dev})
+            if len(batch) == batch_size:
+                connection.execute(set_user, batch)
+                connection.execute(set_features, batch)
+                updated += len(batch)
+                batch = []
+        if batch:
+            connection.execute(set_user, batch)
+            connection.execute(set_features, batch)
+            updated += len(batch)
+
+    return {
+        "chunks": len(jobs),
+        "workers": workers if len(jobs) > 1 else 1,
+        "rows_scanned": int(accumulator.count[:len(accumulator.index)].sum()),
+        "users_with_history": updated,
+        "seconds": round(time.monotonic() - started, 2),
+    }
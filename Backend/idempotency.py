@@ -0,0 +1,56 @@
+import threading
+
+# Per-worker registry of idempotency keys whose first request is still being
+# processed. The first request for a key becomes its owner; duplicates that
+# arrive meanwhile wait on the owner's entry and are answered with the same
+# encoded body instead of running the request again.
+#
+# This only coordinates requests inside one worker. Across workers the owner
+# also holds a reservation row in idempotency_logs (see handle_idempotency).
+
+
+class InFlight:
+    def __init__(self):
+        self._done = threading.Event()
+        self.body = None
+        self.waiters = 0
+
+    def wait(self, timeout):
+        # The owner's body, or None if it gave up or the timeout passed
+        self._done.wait(max(0.0, timeout))
+        return self.body
+
+
+class InFlightRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0   # Duplicates answered with the owner's body
+        self.timeouts = 0    # Duplicates that gave up waiting
+
+    def claim(self, key):
+        # Returns (entry, owner); owner is True for the first caller
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = InFlight()
+                return entry, True
+            entry.waiters += 1
+            return entry, False
+
+    def finish(self, key, body):
+        self._settle(key, body)
+
+    def release(self, key):
+        # Owner gave up without a response; one waiter will claim the key next
+        self._settle(key, None)
+
+    def _settle(self, key, body):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.body = body
+            entry._done.set()
+
+    def stats(self):
+        return {"in_flight": len(self._entries), "coalesced": self.coalesced, "timeouts": self.timeouts}
@@ -0,0 +1,511 @@
+import heapq
+import json
+import mmap
+import os
+import sys
+import threading
+import zlib
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import case, column, text, select, delete, func, table
+
+# Archived months live in one immutable columnar file each:
+#
+#   MAGIC | column blocks ... | footer (JSON) | footer length (8 bytes) | MAGIC
+#
+# Numeric columns and dictionary codes are written raw so the reader can
+# memory-map them without copying. Dictionaries (the distinct strings of a
+# column) are zlib-compressed. Rows are sorted by username so a user's history
+# is one contiguous slice, found through the "username_offsets" column.
+
+MAGIC = b"GPCOL1\n\x00"
+ARCHIVE_SUFFIX = ".gpcol"
+STRING_COLUMNS = ["idempotency_key", "username", "recipient", "type", "state"]
+NUMERIC_COLUMNS = {"id": "q", "amount": "d", "timestamp": "d"}
+
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(dt, months):
+    index = dt.year * 12 + (dt.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def archive_name(month):
+    return f"transaction_logs_{month:%Y_%m}{ARCHIVE_SUFFIX}"
+
+
+def partition_name(table_name, month):
+    return f"{table_name}_y{month:%Y}m{month:%m}"
+
+
+def _to_epoch(value):
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _state_value(value):
+    return getattr(value, "value", value)
+
+
+# --- WRITER ---
+
+def archive_sort_key(row):
+    # NULL usernames first, then code point order: the order of the final
+    # dictionary codes, which username_offsets relies on
+    return (row["username"] is not None, row["username"] or "", _to_epoch(row["timestamp"]))
+
+
+class ArchiveWriter:
+    # Writes rows that arrive already in archive_sort_key order without holding
+    # them: each column is appended to its own spill file, strings as
+    # provisional codes in first-seen order. close() renumbers the codes to the
+    # sorted dictionaries and copies the spills into the archive. Memory is
+    # one chunk of rows plus the distinct strings of each column.
+
+    def __init__(self, path, chunk_rows=50_000):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.row_count = 0
+        self._chunk = []
+        self._spills = {
+            name: open(f"{path}.{name}.spill", "w+b")
+            for name in [*NUMERIC_COLUMNS, *STRING_COLUMNS]
+        }
+        self._lookups = {name: {} for name in STRING_COLUMNS}
+        self._user_counts = array("Q", [0])   # Rows per provisional username code
+        self._state_counts = {}
+        self._approved_volume = 0.0
+        self._min_timestamp = None
+        self._max_timestamp = None
+
+    def add(self, row):
+        self._chunk.append(row)
+        if len(self._chunk) >= self.chunk_rows:
+            self._spill_chunk()
+
+    def _spill_chunk(self):
+        rows, self._chunk = self._chunk, []
+        if not rows:
+            return
+        self.row_count += len(rows)
+
+        timestamps = array("d", (_to_epoch(r["timestamp"]) for r in rows))
+        for name, typecode in NUMERIC_COLUMNS.items():
+            values = timestamps if name == "timestamp" else array(typecode, (r[name] or 0 for r in rows))
+            self._spills[name].write(values.tobytes())
+
+        for name in STRING_COLUMNS:
+            lookup = self._lookups[name]
+            codes = array("I")
+            for r in rows:
+                value = _state_value(r[name])
+                if value is None:
+                    codes.append(0)
+                    continue
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(lookup) + 1
+                    if name == "username":
+                        self._user_counts.append(0)
+                codes.append(code)
+                if name == "username":
+                    self._user_counts[code] += 1
+                elif name == "state":
+                    self._state_counts[value] = self._state_counts.get(value, 0) + 1
+            if name == "username":
+                self._user_counts[0] += codes.count(0)
+            self._spills[name].write(codes.tobytes())
+
+        for r in rows:
+            if _state_value(r["state"]) == "APPROVED":
+                self._approved_volume += r["amount"] or 0.0
+        low, high = min(timestamps), max(timestamps)
+        self._min_timestamp = low if self._min_timestamp is None else min(self._min_timestamp, low)
+        self._max_timestamp = high if self._max_timestamp is None else max(self._max_timestamp, high)
+
+    def close(self):
+        self._spill_chunk()
+        columns = {}
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as out:
+                out.write(MAGIC)
+
+                def start_block():
+                    padding = (-out.tell()) % 8  # keep raw arrays 8-byte aligned for mmap casts
+                    out.write(b"\x00" * padding)
+                    return out.tell()
+
+                def add_block(name, chunks, kind, **meta):
+                    offset = start_block()
+                    for payload in chunks:
+                        out.write(payload)
+                    columns[name] = {"offset": offset, "length": out.tell() - offset, "kind": kind, **meta}
+
+                for name, typecode in NUMERIC_COLUMNS.items():
+                    add_block(name, self._read_spill(name), "raw", typecode=typecode)
+
+                for name in STRING_COLUMNS:
+                    lookup = self._lookups[name]
+                    dictionary = sorted(lookup)
+                    renumber = array("I", [0]) * (len(lookup) + 1)   # provisional code -> final code
+                    for final, value in enumerate(dictionary, 1):
+                        renumber[lookup[value]] = final
+                    add_block(f"{name}.dict", _compressed_json_list(dictionary), "zlib-json")
+                    add_block(name, self._renumbered(name, renumber), "raw", typecode="I")
+
+                    if name == "username":
+                        # Rows arrive sorted by username, so each code owns one contiguous slice
+                        offsets = array("I", [0]) * (len(dictionary) + 2)
+                        offsets[1] = self._user_counts[0]
+                        for final, value in enumerate(dictionary, 1):
+                            offsets[final + 1] = offsets[final] + self._user_counts[lookup[value]]
+                        add_block("username_offsets", [offsets.tobytes()], "raw", typecode="I")
+
+                footer = {
+                    "row_count": self.row_count,
+                    "byteorder": sys.byteorder,
+                    "columns": columns,
+                    "summary": {
+                        "state_counts": self._state_counts,
+                        "approved_volume": self._approved_volume,
+                        "min_timestamp": self._min_timestamp,
+                        "max_timestamp": self._max_timestamp,
+                    },
+                }
+                footer_bytes = json.dumps(footer).encode()
+                out.write(footer_bytes)
+                out.write(len(footer_bytes).to_bytes(8, "little"))
+                out.write(MAGIC)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, self.path)  # readers never see a half-written file
+        finally:
+            self._discard_spills()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return self.row_count
+
+    def abort(self):
+        self._discard_spills()
+
+    def _read_spill(self, name, block_size=1 << 20):
+        spill = self._spills[name]
+        spill.seek(0)
+        while True:
+            payload = spill.read(block_size)
+            if not payload:
+                return
+            yield payload
+
+    def _renumbered(self, name, renumber):
+        previous = 0
+        for payload in self._read_spill(name, 1 << 20):
+            codes = array("I", payload)
+            final = array("I", (renumber[c] for c in codes))
+            if name == "username":
+                if final and (final[0] < previous or any(a > b for a, b in zip(final, final[1:]))):
+                    raise ValueError("Rows must arrive in archive_sort_key order")
+                previous = final[-1] if final else previous
+            yield final.tobytes()
+
+    def _discard_spills(self):
+        for spill in self._spills.values():
+            spill.close()
+            try:
+                os.remove(spill.name)
+            except FileNotFoundError:
+                pass
+
+
+def _compressed_json_list(values):
+    compressor = zlib.compressobj(6)
+    yield compressor.compress(b"[")
+    for i, value in enumerate(values):
+        yield compressor.compress((("," if i else "") + json.dumps(value)).encode())
+    yield compressor.compress(b"]")
+    yield compressor.flush()
+
+
+def write_archive(path, rows):
+    writer = ArchiveWriter(path)
+    try:
+        for row in sorted(rows, key=archive_sort_key):
+            writer.add(row)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+# --- MEMORY-MAPPED READER ---
+
+class ArchiveReader:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[:len(MAGIC)] != MAGIC or self._mm[-len(MAGIC):] != MAGIC:
+            raise ValueError(f"{path} is not a transaction log archive")
+
+        end = len(self._mm) - len(MAGIC)
+        footer_length = int.from_bytes(self._mm[end - 8:end], "little")
+        self.footer = json.loads(self._mm[end - 8 - footer_length:end - 8])
+        self.row_count = self.footer["row_count"]
+        self.summary = self.footer["summary"]
+        self._dictionaries = {}
+        self.users = 0          # Requests currently reading it (ArchiveStore.readers)
+        self.retired = False    # Its file was rewritten or removed; closed once unused
+
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            # A column view outlived its request; the map is released with the reader
+            return
+        self._file.close()
+
+    def column(self, name):
+        meta = self.footer["columns"][name]
+        view = memoryview(self._mm)[meta["offset"]:meta["offset"] + meta["length"]]
+        if self.footer["byteorder"] != sys.byteorder:
+            values = array(meta["typecode"], view.tobytes())
+            values.byteswap()
+            return values
+        return view.cast(meta["typecode"])
+
+    def dictionary(self, name):
+        if name not in self._dictionaries:
+            meta = self.footer["columns"][f"{name}.dict"]
+            payload = self._mm[meta["offset"]:meta["offset"] + meta["length"]]
+            self._dictionaries[name] = [None] + json.loads(zlib.decompress(payload))
+        return self._dictionaries[name]
+
+    def _code_of(self, name, value):
+        dictionary = self.dictionary(name)
+        # Dictionaries are sorted, but entry 0 is the NULL slot
+        lo, hi = 1, len(dictionary)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if dictionary[mid] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(dictionary) and dictionary[lo] == value else None
+
+    def row_indexes(self, username=None, recipient=None):
+        indexes = set()
+
+        if username is not None:
+            code = self._code_of("username", username)
+            if code is not None:
+                offsets = self.column("username_offsets")
+                indexes.update(range(offsets[code], offsets[code + 1]))
+
+        if recipient is not None:
+            code = self._code_of("recipient", recipient)
+            if code is not None:
+                codes = self.column("recipient")
+                indexes.update(i for i, c in enumerate(codes) if c == code)
+
+        return sorted(indexes)
+
+    def rows(self, indexes):
+        numeric = {name: self.column(name) for name in NUMERIC_COLUMNS}
+        strings = {name: (self.column(name), self.dictionary(name)) for name in STRING_COLUMNS}
+
+        for i in indexes:
+            row = {name: values[i] for name, values in numeric.items()}
+            row["timestamp"] = datetime.fromtimestamp(row["timestamp"], timezone.utc).replace(tzinfo=None)
+            for name, (codes, dictionary) in strings.items():
+                row[name] = dictionary[codes[i]]
+            yield row
+
+
+class ArchiveStore:
+    # Readers are shared by concurrent requests. Each request holds the ones it
+    # uses; a reader whose file changed is retired and closed by whichever
+    # request lets go of it last, never under another request's feet.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._readers = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        current = {}
+        if os.path.isdir(self.directory):
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(ARCHIVE_SUFFIX):
+                    continue
+                path = os.path.join(self.directory, name)
+                stamp = os.stat(path).st_mtime_ns
+                cached = self._readers.get(path)
+                if cached is None or cached[0] != stamp:
+                    cached = (stamp, ArchiveReader(path))
+                current[path] = cached
+
+        for path, (stamp, reader) in self._readers.items():
+            if current.get(path, (None, None))[1] is not reader:
+                reader.retired = True
+                if not reader.users:
+                    reader.close()
+        self._readers = current
+        return [reader for _, reader in current.values()]
+
+    @contextmanager
+    def readers(self):
+        with self._lock:
+            readers = self._refresh()
+            for reader in readers:
+                reader.users += 1
+        try:
+            yield readers
+        finally:
+            with self._lock:
+                for reader in readers:
+                    reader.users -= 1
+                    if reader.retired and not reader.users:
+                        reader.close()
+
+    def history(self, username, include_received=False):
+        rows = []
+        with self.readers() as readers:
+            for reader in readers:
+                indexes = reader.row_indexes(username, username if include_received else None)
+                rows.extend(reader.rows(indexes))
+        rows.sort(key=lambda r: r["timestamp"])
+        return rows
+
+    def summary(self):
+        totals = {"row_count": 0, "state_counts": {}, "approved_volume": 0.0}
+        with self.readers() as readers:
+            for reader in readers:
+                totals["row_count"] += reader.row_count
+                totals["approved_volume"] += reader.summary["approved_volume"]
+                for state, count in reader.summary["state_counts"].items():
+                    totals["state_counts"][state] = totals["state_counts"].get(state, 0) + count
+        return totals
+
+
+# --- POSTGRES PARTITION MAINTENANCE ---
+
+def is_partitioned(connection, table_name):
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :name"
+    ), {"name": table_name}).first())
+
+
+def partition_exists(connection, name):
+    return bool(connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar())
+
+
+def ensure_month_partitions(connection, table_name, months_ahead=2):
+    # Native partitioning only: Postgres routes inserts itself, the ORM is unchanged
+    if not is_partitioned(connection, table_name):
+        return []
+
+    created = []
+    this_month = month_start(datetime.now(timezone.utc))
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {table_name}_default PARTITION OF {table_name} DEFAULT"))
+    for i in range(months_ahead + 1):
+        start = add_months(this_month, i)
+        name = partition_name(table_name, start)
+        if partition_exists(connection, name):
+            continue
+        connection.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {table_name} "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{add_months(start, 1):%Y-%m-%d}')"
+        ))
+        created.append(name)
+    return created
+
+
+# --- ARCHIVAL JOB ---
+
+def archive_order(connection, log_table):
+    # archive_sort_key in SQL: byte-order collation matches Python's code point order
+    collation = "C" if connection.dialect.name == "postgresql" else "BINARY"
+    username = log_table.c.username
+    return [case((username.is_(None), 0), else_=1), username.collate(collation), log_table.c.timestamp]
+
+
+def archive_old_months(db, log_table, archive_dir, older_than_months, fetch_rows=5000):
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = add_months(month_start(datetime.now(timezone.utc)), -older_than_months)
+
+    oldest = db.execute(select(func.min(log_table.c.timestamp))).scalar()
+    if oldest is None:
+        return []
+
+    archived = []
+    partitioned = is_partitioned(db.connection(), log_table.name)
+    month = month_start(oldest)
+
+    while month < cutoff:
+        connection = db.connection()   # Each month commits, which hands the connection back
+        next_month = add_months(month, 1)
+        path = os.path.join(archive_dir, archive_name(month))
+        partition = partition_name(log_table.name, month)
+
+        if partitioned and partition_exists(connection, partition):
+            # Detach first so the hot table stops scanning it, then drop once on disk
+            connection.execute(text(f"ALTER TABLE {log_table.name} DETACH PARTITION {partition}"))
+            source = table(partition, *[column(c.name) for c in log_table.c])
+            query = select(source)
+            drop = text(f"DROP TABLE {partition}")
+        else:
+            in_month = (log_table.c.timestamp >= month) & (log_table.c.timestamp < next_month)
+            source = log_table
+            query = select(log_table).where(in_month)
+            drop = delete(log_table).where(in_month)
+
+        # Streamed in archive order through a server-side cursor, never held whole
+        query = query.order_by(*archive_order(connection, source)).execution_options(yield_per=fetch_rows)
+        rows = (dict(r._mapping) for r in connection.execute(query))
+
+        previous = ArchiveReader(path) if os.path.exists(path) else None
+        if previous is not None:
+            # A late re-run for the same month: merge with what is already archived
+            known = set(previous.column("id"))
+            rows = heapq.merge(
+                (r for r in rows if r["id"] not in known),
+                previous.rows(range(previous.row_count)),
+                key=archive_sort_key,
+            )
+
+        writer = ArchiveWriter(path + ".new")
+        try:
+            for row in rows:
+                writer.add(row)
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            if previous is not None:
+                previous.close()
+        count = writer.close()
+
+        if count:
+            os.replace(path + ".new", path)
+            archived.append({"month": f"{month:%Y-%m}", "rows": count, "file": path})
+        else:
+            os.remove(path + ".new")
+
+        db.execute(drop)
+        db.commit()
+        month = next_month
+
+    return archived
@@ -0,0 +1,207 @@
+import argparse
+import itertools
+import json
+import sys
+
+import main
+from blacklist_matcher import ImportBatch, LineSplitter
+from fingerprint_batch import recompute_fingerprints
+from log_archive import archive_old_months, ensure_month_partitions
+from risk_rules import LazyFeatures
+
+# Maintenance commands, run next to the API:
+#   python manage.py archive-logs --older-than-months 6
+#   python manage.py rebuild-features           (with transfers stopped)
+#   python manage.py recompute-fingerprints --workers 8
+#   python manage.py import-blacklist feed.csv
+#   python manage.py verify-rules
+
+
+def archive_logs(args):
+    with main.engine.begin() as connection:
+        created = ensure_month_partitions(connection, main.TransactionLogDB.__tablename__, main.PARTITION_MONTHS_AHEAD)
+
+    db = main.SessionLocal()
+    try:
+        archived = archive_old_months(db, main.TransactionLogDB.__table__, args.archive_dir, args.older_than_months)
+    finally:
+        db.close()
+
+    print(json.dumps({"partitions_created": created, "archived": archived}, indent=2))
+
+
+def rebuild_features(args):
+    db = main.SessionLocal()
+    try:
+        count = main.rebuild_risk_features(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+
+    print(json.dumps({"snapshots_rebuilt": count}))
+
+
+def recompute_fingerprints_command(args):
+    result = recompute_fingerprints(
+        main.engine,
+        main.TransactionLogDB.__table__,
+        main.UserDB.__table__,
+        main.UserRiskFeaturesDB.__table__,
+        main.TransactionState.APPROVED,
+        workers=args.workers,
+        chunk_rows=args.chunk_rows,
+        batch_size=args.batch_size,
+    )
+    print(json.dumps(result, indent=2))
+
+
+def import_blacklist(args):
+    # Same parsing and batching as POST /admin/blacklist/import. Running API
+    # workers only see the new entries through a shared STATE_BACKEND.
+    batch = ImportBatch(args.format, args.reason, args.batch_size)
+    parsed = exact_added = patterns_added = 0
+
+    def write(entries):
+        nonlocal parsed, exact_added, patterns_added
+        ids, patterns = main.write_blacklist_batch(entries)
+        parsed += len(entries)
+        exact_added += ids
+        patterns_added += patterns
+
+    lines = LineSplitter(main.BLACKLIST_IMPORT_MAX_LINE_BYTES)
+    with open(args.path, "rb") as feed:
+        for chunk in iter(lambda: feed.read(1 << 16), b""):
+            for line in lines.feed(chunk):
+                if batch.feed(line):
+                    write(batch.take())
+    for line in lines.finish():
+        batch.feed(line)
+    if batch.entries:
+        write(batch.take())
+
+    print(json.dumps({
+        "format": batch.fmt or "csv",
+        "lines": batch.lines,
+        "invalid": batch.invalid,
+        "exact_added": exact_added,
+        "patterns_added": patterns_added,
+        "duplicates": parsed - exact_added - patterns_added,
+    }, indent=2))
+
+
+def legacy_risk_score(f):
+    # The hard-coded scoring perform_transfer used before risk_rules.json,
+    # kept verbatim as the reference the compiled rules must reproduce.
+    total, factors = 0, set()
+    if f["aura_score"] < 50:
+        total += 20
+        factors.add("Low User Reputation (+20)")
+    if f["recipient_blacklisted"]:
+        total += 80
+        factors.add("Blacklisted Recipient (+80)")
+    if f["approved_count"] >= 3:
+        total += 45
+        factors.add(f"Velocity Spike: {f['approved_count']} successful tx (+45)")
+    if f["blocked_count"] > 0:
+        penalty = f["blocked_count"] * 10
+        total += penalty
+        factors.add(f"Recent Failed/Blocked Attempts Found (+{penalty})")
+    if f["total_tx_count"] >= 5:
+        if f["amount"] > f["avg_tx_amount"] + (3 * f["std_dev_amount"]):
+            total += 25
+            factors.add("Behavioral Outlier: Exceeds 3-sigma personal limit (+25)")
+    else:
+        if f["early_avg_amount"] and f["amount"] > (f["early_avg_amount"] * 3):
+            total += 25
+            factors.add("Anomalous Amount vs Early Avg (+25)")
+    if f["amount"] > 5000:
+        total += 15
+        factors.add("High Value Transaction (+15)")
+    adaptive_max_tx = 3
+    if f["aura_score"] > 90:
+        adaptive_max_tx += 2
+    elif f["aura_score"] < 40:
+        adaptive_max_tx = 1
+    if f["approved_count"] >= adaptive_max_tx:
+        total += 45
+        factors.add("Adaptive Velocity Trigger: Limit reduced due to low Aura (+45)")
+    return min(main.MAX_RISK_CAP, total), factors
+
+
+# Exhaustive grid over every boundary the rules branch on
+VERIFY_GRID = {
+    "aura_score": [0.0, 39.9, 40.0, 49.9, 50.0, 90.0, 90.1, 100.0],
+    "recipient_blacklisted": [False, True],
+    "approved_count": list(range(7)),
+    "blocked_count": [0, 1, 3, 9],
+    "total_tx_count": [0, 4, 5, 30],
+    "avg_tx_amount": [0.0, 100.0],
+    "std_dev_amount": [0.0, 50.0],
+    "early_avg_amount": [None, 0.0, 100.0],
+    "amount": [0.0, 100.0, 250.0, 300.0, 300.01, 5000.0, 5000.01, 90000.0],
+}
+
+
+def compare_with_legacy(ruleset, grid=VERIFY_GRID):
+    checked, mismatches = 0, []
+
+    for values in itertools.product(*grid.values()):
+        f = dict(zip(grid, values))
+        # Features the legacy engine never had are held at 0 (no samples, no relay
+        # activity...), where their rules stay silent and the legacy branches apply
+        resolvers = {name: (0, lambda ctx, name=name: ctx.get(name, 0)) for name in main.RISK_FEATURES}
+        score, messages, _ = ruleset.evaluate(LazyFeatures(resolvers, f), main.MAX_RISK_CAP)
+        score = min(main.MAX_RISK_CAP, score)
+        expected_score, expected_factors = legacy_risk_score(f)
+        checked += 1
+
+        # Short-circuiting may leave out factors once the cap is hit, never add any
+        if score != expected_score or not set(messages) <= expected_factors or (
+            score < main.MAX_RISK_CAP and set(messages) != expected_factors
+        ):
+            mismatches.append({"features": f, "rules": [score, messages], "legacy": [expected_score, sorted(expected_factors)]})
+
+    return checked, mismatches
+
+
+def verify_rules(args):
+    checked, mismatches = compare_with_legacy(main.risk_rules_engine.current())
+    print(json.dumps({"cases_checked": checked, "mismatches": len(mismatches), "examples": mismatches[:5]}, indent=2, default=str))
+    if mismatches:
+        sys.exit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Guard Pay maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive = commands.add_parser("archive-logs", help="Move old transaction_logs months to columnar archive files")
+    archive.add_argument("--older-than-months", type=int, default=main.ARCHIVE_AFTER_MONTHS)
+    archive.add_argument("--archive-dir", default=main.ARCHIVE_DIR)
+    archive.set_defaults(handler=archive_logs)
+
+    rebuild = commands.add_parser("rebuild-features", help="Regenerate user_risk_features from transaction_logs (stop transfers first)")
+    rebuild.add_argument("--batch-size", type=int, default=5000)
+    rebuild.set_defaults(handler=rebuild_features)
+
+    fingerprints = commands.add_parser("recompute-fingerprints", help="Recompute every user's amount fingerprint from transaction_logs")
+    fingerprints.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    fingerprints.add_argument("--chunk-rows", type=int, default=200_000, help="transaction_logs ids per chunk")
+    fingerprints.add_argument("--batch-size", type=int, default=5000)
+    fingerprints.set_defaults(handler=recompute_fingerprints_command)
+
+    blacklist = commands.add_parser("import-blacklist", help="Bulk-load a CSV or NDJSON threat feed into the blacklist")
+    blacklist.add_argument("path")
+    blacklist.add_argument("--format", choices=("auto", "csv", "ndjson"), default="auto")
+    blacklist.add_argument("--reason", default="Threat feed", help="For entries without their own reason")
+    blacklist.add_argument("--batch-size", type=int, default=main.BLACKLIST_IMPORT_BATCH_SIZE)
+    blacklist.set_defaults(handler=import_blacklist)
+
+    verify = commands.add_parser("verify-rules", help="Prove risk_rules.json scores exactly like the legacy engine")
+    verify.set_defaults(handler=verify_rules)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.handler(args)
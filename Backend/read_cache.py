@@ -0,0 +1,87 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Conditional GET support for the per-user read endpoints.
+#
+# Every write path bumps the version of the users it touched. A read endpoint
+# tags its response with that version as a weak ETag, answers 304 when the
+# client already has it, and keeps the encoded body in a small LRU so repeat
+# polls between writes never reach the database or the JSON encoder.
+
+
+class VersionStamps:
+    # Versions live in the state backend, so every worker tags a user's
+    # responses the same way and a write on one worker invalidates all of them.
+
+    def __init__(self, backend, ttl_seconds=7 * 24 * 3600):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    def ensure_epoch(self):
+        # A random epoch stored next to the versions: if the backend is wiped,
+        # versions restart but old ETags can no longer match
+        if not self.backend.get("ver:epoch"):
+            self.backend.incr("ver:epoch", secrets.randbelow(1 << 30) + 1)
+
+    def bump(self, *usernames):
+        # Returns the new version of each user
+        versions = {}
+        for username in usernames:
+            if not username:
+                continue
+            key = f"ver:{username}"
+            version = self.backend.incr(key, 1, ttl=self.ttl_seconds)
+            if version == 1:
+                # Fresh (or expired) key: jump to the clock so versions never repeat
+                version = self.backend.incr(key, int(time.time() * 1000), ttl=self.ttl_seconds)
+            versions[username] = version
+        return versions
+
+    def version(self, username):
+        return self.backend.get(f"ver:{username}")
+
+    def etag(self, username):
+        epoch, version = self.backend.get_many(["ver:epoch", f"ver:{username}"])
+        return f'W/"{epoch:x}-{version}"'
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, etag, body):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (etag, time.monotonic() + self.ttl_seconds, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
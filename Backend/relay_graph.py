@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+
+# In-memory directed graph of recent money movement, used to spot mule relays:
+# accounts that receive funds and push most of them onward within minutes, and
+# hubs that collect from (or spray to) many accounts.
+#
+# The graph only holds edges from the last `window_seconds`. Every node keeps at
+# most `max_edges_per_node` edges in each direction and chain walks visit a
+# fixed number of branches, so one assessment costs bounded time no matter how
+# busy an account is.
+
+
+class TransferGraph:
+    def __init__(self, window_seconds=1800, max_edges_per_node=256, max_branches=8, max_depth=3):
+        self.window_seconds = window_seconds
+        self.max_edges_per_node = max_edges_per_node
+        self.max_branches = max_branches
+        self.max_depth = max_depth
+        self._out = {}              # node -> deque[(ts, recipient, amount)]
+        self._in = {}               # node -> deque[(ts, sender, amount)]
+        self._timeline = deque()    # (ts, sender, recipient) in arrival order, for eviction
+        self._lock = threading.Lock()
+        self.edge_count = 0
+
+    def add(self, sender, recipient, amount, ts):
+        with self._lock:
+            for table, node, other in ((self._out, sender, recipient), (self._in, recipient, sender)):
+                edges = table.get(node)
+                if edges is None:
+                    edges = table[node] = deque(maxlen=self.max_edges_per_node)
+                edges.append((ts, other, amount))
+            self._timeline.append((ts, sender, recipient))
+            self.edge_count += 1
+
+    def evict(self, now):
+        cutoff = now - self.window_seconds
+        with self._lock:
+            while self._timeline and self._timeline[0][0] < cutoff:
+                _, sender, recipient = self._timeline.popleft()
+                self.edge_count -= 1
+                for table, node in ((self._out, sender), (self._in, recipient)):
+                    edges = table.get(node)
+                    # Capped deques may already have dropped this edge
+                    while edges and edges[0][0] < cutoff:
+                        edges.popleft()
+                    if edges is not None and not edges:
+                        del table[node]
+
+    def _recent(self, table, node, since):
+        return [edge for edge in table.get(node, ()) if edge[0] >= since]
+
+    def _forward_ratio(self, node, pending_amount, now):
+        # Share of the money received in the window that has already left again
+        inbound = self._recent(self._in, node, now - self.window_seconds)
+        if not inbound:
+            return 0.0, 0.0, inbound
+        first_received = min(ts for ts, _, _ in inbound)
+        received = sum(amount for _, _, amount in inbound)
+        forwarded = sum(amount for ts, _, amount in self._recent(self._out, node, first_received)) + pending_amount
+        return (forwarded / received if received else 0.0), received, inbound
+
+    def _chain_depth(self, node, now, ratio_limit, depth, seen):
+        # How many relay hops lead into `node`, following at most max_branches senders per hop
+        if depth >= self.max_depth:
+            return depth
+        deepest = depth
+        inbound = self._recent(self._in, node, now - self.window_seconds)
+        for _, sender, _ in inbound[-self.max_branches:]:
+            if sender in seen:
+                continue
+            seen.add(sender)
+            ratio, _, _ = self._forward_ratio(sender, 0.0, now)
+            if ratio >= ratio_limit:
+                deepest = max(deepest, self._chain_depth(sender, now, ratio_limit, depth + 1, seen))
+        return deepest
+
+    def assess(self, node, recipient, amount, now, ratio_limit=0.8):
+        with self._lock:
+            ratio, received, inbound = self._forward_ratio(node, amount, now)
+            outbound = self._recent(self._out, node, now - self.window_seconds)
+            fan_out = {other for _, other, _ in outbound}
+            fan_out.add(recipient)
+            chain = self._chain_depth(node, now, ratio_limit, 1, {node}) if ratio >= ratio_limit else 0
+            return {
+                "forward_ratio": round(ratio, 4),
+                "inbound_total": received,
+                "fan_in": len({other for _, other, _ in inbound}),
+                "fan_out": len(fan_out),
+                "chain_depth": chain,
+            }
+
+    def stats(self):
+        return {"nodes_with_outbound": len(self._out), "nodes_with_inbound": len(self._in), "edges": self.edge_count}
+
+
+class RelayGraphFeed:
+    # Keeps a TransferGraph in step with approved transaction_logs rows by
+    # tailing the primary key. A short overlap re-reads recent ids so rows that
+    # committed out of order are still picked up exactly once.
+
+    def __init__(self, graph, edge_types, ignored_recipients, refresh_seconds=0.5, overlap=500, batch_size=5000):
+        self.graph = graph
+        self.edge_types = set(edge_types)
+        self.ignored_recipients = set(ignored_recipients)
+        self.refresh_seconds = refresh_seconds
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.last_id = None
+        self._seen = deque(maxlen=overlap * 4)
+        self._seen_set = set()
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _remember(self, row_id):
+        if len(self._seen) == self._seen.maxlen:
+            self._seen_set.discard(self._seen[0])
+        self._seen.append(row_id)
+        self._seen_set.add(row_id)
+
+    def refresh(self, db, log_model, approved_state, force=False):
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+            return
+        if not self._lock.acquire(blocking=False):
+            return  # Another request is already catching up
+        try:
+            self._refreshed_at = time.monotonic()
+            query = db.query(log_model.id, log_model.username, log_model.recipient, log_model.amount, log_model.timestamp).filter(
+                log_model.state == approved_state,
+                log_model.type.in_(self.edge_types),
+            )
+            now = time.time()
+            if self.last_id is None:
+                # First load: only the rows still inside the graph window
+                since = now - self.graph.window_seconds
+                query = query.filter(log_model.timestamp >= _naive_utc(since))
+            else:
+                query = query.filter(log_model.id > self.last_id - self.overlap)
+
+            for row_id, sender, recipient, amount, timestamp in query.order_by(log_model.id).limit(self.batch_size):
+                self.last_id = max(self.last_id or 0, row_id)
+                if row_id in self._seen_set:
+                    continue
+                self._remember(row_id)
+                if recipient in self.ignored_recipients:
+                    continue
+                self.graph.add(sender, recipient, amount or 0.0, _epoch(timestamp))
+
+            if self.last_id is None:
+                # Nothing approved inside the window: tail from the newest row,
+                # not from id 0, which would replay the whole table batch by batch
+                self.last_id = db.query(func.max(log_model.id)).scalar() or 0
+            self.graph.evict(now)
+        finally:
+            self._lock.release()
+
+
+def _epoch(timestamp):
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _naive_utc(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,205 @@
+import ast
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("guardpay")
+
+# Risk rules are declared in a JSON file and compiled once per load:
+#
+#   {"params": {"WEIGHT_BLACKLIST": 80},
+#    "rules": [{"id": "blacklisted_recipient",
+#               "when": "recipient_blacklisted",
+#               "points": "WEIGHT_BLACKLIST",
+#               "message": "Blacklisted Recipient (+{points})"}]}
+#
+# "when" and "points" are small Python expressions over params and features
+# (see RISK_FEATURES in main.py). Features are resolved lazily, and each rule
+# costs the sum of the features it reads, so rules run cheapest-first and the
+# expensive lookups are skipped once the score has reached the cap. Points are
+# never negative: constant ones are checked when the file loads, and an
+# expression that goes below zero on some input is clamped to 0.
+
+SAFE_FUNCTIONS = {"min": min, "max": max, "abs": abs, "round": round, "len": len}
+
+ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.IfExp, ast.Call, ast.Name, ast.Load, ast.Constant, ast.Tuple, ast.List,
+)
+
+
+class RuleError(ValueError):
+    pass
+
+
+class LazyFeatures:
+    # Mapping handed to eval(): a feature is computed on first use, then cached
+
+    def __init__(self, resolvers, context):
+        self._resolvers = resolvers
+        self._context = context
+        self._values = {}
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            if name not in self._resolvers:
+                raise KeyError(name)
+            self._values[name] = self._resolvers[name][1](self._context)
+        return self._values[name]
+
+    def resolved(self):
+        return dict(self._values)
+
+
+class CompiledRule:
+    __slots__ = ("rule_id", "when", "points", "message", "cost", "order")
+
+    def __init__(self, rule_id, when, points, message, cost, order):
+        self.rule_id = rule_id
+        self.when = when
+        self.points = points
+        self.message = message
+        self.cost = cost
+        self.order = order
+
+
+class RuleSet:
+    def __init__(self, rules, params, version):
+        self.rules = rules
+        self.params = params
+        self.version = version
+        self._globals = {"__builtins__": {}, **SAFE_FUNCTIONS, **params}
+        self._clamped = set()
+
+    def evaluate(self, features, risk_cap):
+        total = 0
+        messages = []
+        fired = []
+
+        for rule in self.rules:
+            if total >= risk_cap:
+                # Points are never negative, so nothing left can change the capped score
+                break
+            if not eval(rule.when, self._globals, features):
+                continue
+
+            points = eval(rule.points, self._globals, features)
+            if points < 0:
+                # Constant points are checked at load; a feature-dependent expression
+                # that dips below zero counts as 0 rather than failing the transfer
+                if rule.rule_id not in self._clamped:
+                    self._clamped.add(rule.rule_id)
+                    logger.warning("Rule %s produced negative points (%s), clamping to 0", rule.rule_id, points)
+                points = 0
+            total += points
+            fired.append(rule.rule_id)
+            messages.append(rule.message.format_map(_MessageValues(features, points)))
+
+        return total, messages, fired
+
+
+class _MessageValues:
+    def __init__(self, features, points):
+        self._features = features
+        self._points = points
+
+    def __getitem__(self, name):
+        if name == "points":
+            return self._points
+        return self._features[name]
+
+
+def _compile_expression(source, rule_id, field, known_names):
+    if isinstance(source, (int, float)) and not isinstance(source, bool):
+        source = repr(source)
+    try:
+        tree = ast.parse(str(source), mode="eval")
+    except SyntaxError as exc:
+        raise RuleError(f"Rule {rule_id}: invalid {field} expression {source!r}: {exc.msg}") from exc
+
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise RuleError(f"Rule {rule_id}: {type(node).__name__} is not allowed in {field}")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in SAFE_FUNCTIONS):
+            raise RuleError(f"Rule {rule_id}: only {sorted(SAFE_FUNCTIONS)} may be called")
+        if isinstance(node, ast.Name):
+            if node.id not in known_names:
+                raise RuleError(f"Rule {rule_id}: unknown name {node.id!r} in {field}")
+            names.add(node.id)
+
+    return compile(tree, f"<rule {rule_id}.{field}>", "eval"), names
+
+
+def compile_rules(config, feature_costs, version=None):
+    params = dict(config.get("params", {}))
+    known_names = set(feature_costs) | set(params) | set(SAFE_FUNCTIONS)
+    compiled = []
+    seen = set()
+
+    for order, raw in enumerate(config.get("rules", [])):
+        rule_id = raw.get("id")
+        if not rule_id or rule_id in seen:
+            raise RuleError(f"Rule #{order} needs a unique id")
+        seen.add(rule_id)
+
+        when, when_names = _compile_expression(raw.get("when", "True"), rule_id, "when", known_names)
+        points, points_names = _compile_expression(raw.get("points", 0), rule_id, "points", known_names)
+        if not points_names & set(feature_costs):
+            # Points that read no features are fixed for the life of the file, so a
+            # negative value is rejected here instead of at request time
+            try:
+                value = eval(points, {"__builtins__": {}, **SAFE_FUNCTIONS, **params})
+            except Exception as exc:
+                raise RuleError(f"Rule {rule_id}: points failed to evaluate: {exc}") from exc
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                raise RuleError(f"Rule {rule_id}: points must be a non-negative number, got {value!r}")
+
+        message = raw.get("message", rule_id)
+        cost = sum(feature_costs.get(name, 0) for name in when_names | points_names)
+        compiled.append(CompiledRule(rule_id, when, points, message, cost, order))
+
+    # Cheapest first; file order breaks ties so equal-cost rules stay predictable
+    compiled.sort(key=lambda r: (r.cost, r.order))
+    return RuleSet(compiled, params, version)
+
+
+class RuleEngine:
+    def __init__(self, path, feature_costs, reload_seconds=2.0):
+        self.path = path
+        self.feature_costs = feature_costs
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self.ruleset = self._load()
+
+    def _load(self):
+        # Remember the version first so a broken file is reported once, not on every check
+        self._mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding="utf-8") as f:
+            config = json.load(f)
+        return compile_rules(config, self.feature_costs, version=self._mtime)
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_seconds:
+            return self.ruleset
+
+        with self._lock:
+            if now - self._checked_at < self.reload_seconds:
+                return self.ruleset
+            self._checked_at = now
+            try:
+                if os.stat(self.path).st_mtime_ns != self._mtime:
+                    # Build the new set completely before swapping the reference
+                    self.ruleset = self._load()
+                    logger.info("Reloaded risk rules from %s", self.path)
+            except (OSError, ValueError) as exc:
+                # A broken edit keeps the last good rules in service
+                logger.error("Keeping previous risk rules, reload failed: %s", exc)
+        return self.ruleset
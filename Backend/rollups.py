@@ -0,0 +1,186 @@
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert, select, tuple_
+
+# Pre-aggregated metrics for admin charts, so a time range is answered from a
+# few thousand small rows instead of scanning transaction_logs.
+#
+# Rows are (resolution, bucket_start, metric, value). Metrics are additive:
+# "approved", "blocked", "volume", "decisions", "risk_score_sum", "fast_path",
+# "fast_path_disagreed", plus one "rule:<id>" per fired risk rule and one
+# "type:<TYPE>" per log type. Additive rows mean every worker can upsert into
+# the same bucket with value + value, and older buckets can be folded into
+# coarser ones by summing.
+
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+FINER = {"minute": (), "hour": ("minute",), "day": ("minute", "hour")}
+BASE_METRICS = ("approved", "blocked", "volume", "decisions", "risk_score_sum", "fast_path", "fast_path_disagreed")
+
+
+def bucket_start(epoch, resolution):
+    step = RESOLUTIONS[resolution]
+    return datetime.fromtimestamp(epoch - epoch % step, timezone.utc).replace(tzinfo=None)
+
+
+def _epoch(naive_utc):
+    return naive_utc.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RollupBuffer:
+    # Write-behind buffer of per-minute increments. Writers only touch memory;
+    # flush() moves everything pending to the database in one upsert batch.
+
+    def __init__(self):
+        self._pending = defaultdict(float)
+        self._lock = threading.Lock()
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+
+    def add(self, epoch, metric, value=1):
+        with self._lock:
+            self._pending[(bucket_start(epoch, "minute"), metric)] += value
+
+    def record_log(self, state, log_type, amount, epoch):
+        if state == "APPROVED":
+            self.add(epoch, "approved")
+            self.add(epoch, "volume", amount or 0.0)
+        elif state == "BLOCKED":
+            self.add(epoch, "blocked")
+        self.add(epoch, f"type:{log_type}")
+
+    def on_event(self, event):
+        # EventBus listener: risk decisions carry the score and the fired rules
+        if event["type"] != "decision":
+            return
+        self.add(event["ts"], "decisions")
+        self.add(event["ts"], "risk_score_sum", event["risk_score"])
+        for rule in event["rules"]:
+            self.add(event["ts"], f"rule:{rule}")
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+        return pending
+
+    def restore(self, pending):
+        # A failed flush puts its increments back so the next one retries them
+        with self._lock:
+            for key, value in pending.items():
+                self._pending[key] += value
+
+    def flush(self, engine, table):
+        pending = self.drain()
+        if not pending:
+            return 0
+        rows = [
+            {"resolution": "minute", "bucket_start": start, "metric": metric, "value": value}
+            for (start, metric), value in pending.items()
+        ]
+        try:
+            with engine.begin() as connection:
+                upsert_add(connection, table, rows)
+        except Exception:
+            self.restore(pending)
+            self.failed_flushes += 1
+            raise
+        self.flushed_rows += len(rows)
+        return len(rows)
+
+    def stats(self):
+        return {"pending": len(self._pending), "flushed_rows": self.flushed_rows, "failed_flushes": self.failed_flushes}
+
+
+def upsert_add(connection, table, rows):
+    # INSERT ... ON CONFLICT DO UPDATE SET value = value + excluded.value
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        dialect_insert = None
+
+    if dialect_insert is None:
+        # Portable fallback: add to existing rows, insert the rest
+        for row in rows:
+            key = (table.c.resolution == row["resolution"]) & (table.c.bucket_start == row["bucket_start"]) & (table.c.metric == row["metric"])
+            updated = connection.execute(table.update().where(key).values(value=table.c.value + row["value"])).rowcount
+            if not updated:
+                connection.execute(insert(table), [row])
+        return
+
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.resolution, table.c.bucket_start, table.c.metric],
+        set_={"value": table.c.value + statement.excluded.value},
+    )
+    for start in range(0, len(rows), 1000):
+        connection.execute(statement, rows[start:start + 1000])
+
+
+def compact(engine, table, source, target, older_than):
+    # Fold `source` buckets that start before `older_than` into `target`
+    # buckets. The source rows are locked and deleted in the same transaction
+    # as the upsert, so two workers compacting at once never count a row twice.
+    with engine.begin() as connection:
+        rows = connection.execute(
+            select(table.c.bucket_start, table.c.metric, table.c.value).where(
+                table.c.resolution == source, table.c.bucket_start < older_than,
+            ).with_for_update()
+        ).all()
+        if not rows:
+            return 0
+
+        folded = defaultdict(float)
+        for start, metric, value in rows:
+            folded[(bucket_start(_epoch(start), target), metric)] += value
+
+        keys = [(source, start, metric) for start, metric, _ in rows]
+        for offset in range(0, len(keys), 500):
+            connection.execute(
+                delete(table).where(tuple_(table.c.resolution, table.c.bucket_start, table.c.metric).in_(keys[offset:offset + 500]))
+            )
+        upsert_add(connection, table, [
+            {"resolution": target, "bucket_start": start, "metric": metric, "value": value}
+            for (start, metric), value in folded.items()
+        ])
+        return len(rows)
+
+
+def query_series(connection, table, start, end, resolution):
+    # Chart-ready series over [start, end): one value per bucket, gaps filled
+    # with zeros. Finer rows not yet compacted are summed up to `resolution`.
+    step = RESOLUTIONS[resolution]
+    first = _epoch(bucket_start(_epoch(start), resolution))
+    count = max(0, int((_epoch(end) - first + step - 1) // step))
+    buckets = [datetime.fromtimestamp(first + i * step, timezone.utc).replace(tzinfo=None) for i in range(count)]
+
+    values = defaultdict(lambda: [0.0] * count)
+    values.update({name: [0.0] * count for name in BASE_METRICS})
+    rows = []
+    if count:
+        rows = connection.execute(
+            select(table.c.bucket_start, table.c.metric, table.c.value).where(
+                table.c.resolution.in_((resolution,) + FINER[resolution]),
+                table.c.bucket_start >= buckets[0],
+                table.c.bucket_start < end,
+            )
+        )
+    for row_start, metric, value in rows:
+        index = int((_epoch(row_start) - first) // step)
+        if 0 <= index < count:
+            values[metric][index] += value
+
+    decisions, score_sum = values.pop("decisions"), values.pop("risk_score_sum")
+    series = {name: values.pop(name) for name in ("approved", "blocked", "volume", "fast_path", "fast_path_disagreed")}
+    series["decisions"] = decisions
+    series["mean_risk_score"] = [round(s / d, 2) if d else None for s, d in zip(score_sum, decisions)]
+
+    grouped = {"rule": {}, "type": {}}
+    for metric, points in values.items():
+        kind, _, name = metric.partition(":")
+        if kind in grouped:
+            grouped[kind][name] = points
+    return buckets, series, grouped["rule"], grouped["type"]
@@ -0,0 +1,220 @@
+import hashlib
+import math
+import struct
+
+# Fixed-size sketches stored on the user_risk_features row. Their size depends
+# only on their parameters, never on how much traffic a user has.
+
+
+def _hash64(item):
+    return int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    # Distinct-count estimate with 2**precision one-byte registers
+    # (standard error about 1.04 / sqrt(2**precision)).
+
+    def __init__(self, precision=8, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, item):
+        h = _hash64(item)
+        index = h & (self.size - 1)
+        rest = h >> self.precision
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction: linear counting is far more accurate here
+            estimate = m * math.log(m / zeros)
+        return estimate
+
+
+class RollingHyperLogLog:
+    # A ring of HyperLogLogs, one per `bucket_seconds` slice. Counting merges
+    # the slices that are still inside the window, so old recipients age out a
+    # slice at a time.
+    #
+    # Layout: "<BBBI" (version, precision, buckets, bucket_seconds), then per
+    # bucket a uint32 slice number followed by 2**precision registers.
+
+    VERSION = 1
+    HEADER = struct.Struct("<BBBI")
+    SLICE = struct.Struct("<I")
+
+    def __init__(self, precision=8, buckets=4, bucket_seconds=6 * 3600):
+        self.precision = precision
+        self.buckets = buckets
+        self.bucket_seconds = bucket_seconds
+        self._slices = {}  # slice number -> HyperLogLog
+
+    @classmethod
+    def from_bytes(cls, data, precision=8, buckets=4, bucket_seconds=6 * 3600):
+        if not data:
+            return cls(precision, buckets, bucket_seconds)
+        version, stored_precision, stored_buckets, stored_seconds = cls.HEADER.unpack_from(data, 0)
+        if version != cls.VERSION or (stored_precision, stored_buckets, stored_seconds) != (precision, buckets, bucket_seconds):
+            # Settings changed: start over rather than mixing incompatible slices
+            return cls(precision, buckets, bucket_seconds)
+
+        sketch = cls(precision, buckets, bucket_seconds)
+        size = 1 << precision
+        offset = cls.HEADER.size
+        while offset < len(data):
+            (slice_no,) = cls.SLICE.unpack_from(data, offset)
+            offset += cls.SLICE.size
+            sketch._slices[slice_no] = HyperLogLog(precision, data[offset:offset + size])
+            offset += size
+        return sketch
+
+    def to_bytes(self):
+        out = [self.HEADER.pack(self.VERSION, self.precision, self.buckets, self.bucket_seconds)]
+        for slice_no in sorted(self._slices):
+            out.append(self.SLICE.pack(slice_no))
+            out.append(bytes(self._slices[slice_no].registers))
+        return b"".join(out)
+
+    def _live(self, epoch):
+        current = int(epoch // self.bucket_seconds)
+        return current, [n for n in self._slices if current - self.buckets < n <= current]
+
+    def add(self, item, epoch):
+        current, live = self._live(epoch)
+        # Drop slices that left the window; at most `buckets` are ever kept
+        self._slices = {n: self._slices[n] for n in live}
+        if current not in self._slices:
+            self._slices[current] = HyperLogLog(self.precision)
+        self._slices[current].add(item)
+
+    def count(self, epoch, extra=None):
+        _, live = self._live(epoch)
+        union = HyperLogLog(self.precision)
+        for n in live:
+            union.merge(self._slices[n])
+        if extra is not None:
+            union.add(extra)
+        return union.count()
+
+
+class TDigest:
+    # Merging t-digest (Dunning) for per-user amount quantiles. Centroids are
+    # kept small near the tails, so p99 stays accurate with about
+    # `compression` centroids. Digests merge by re-compressing their centroids
+    # together, which is how cohort baselines are built.
+    #
+    # Layout: "<BHIdd" (version, compression, centroid count, min, max), then
+    # float32 (mean, weight) pairs.
+
+    VERSION = 1
+    HEADER = struct.Struct("<BHIdd")
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []   # [mean, weight], sorted by mean after _compress()
+        self._buffer = []
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def add(self, value, weight=1.0):
+        self._buffer.append([float(value), float(weight)])
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 4:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self._buffer.extend([m, w] for m, w in other.centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        items = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in items)
+
+        merged = [items[0][:]]
+        q0 = 0.0
+        q_limit = self._k_inverse(self._k(q0) + 1)
+        for mean, weight in items[1:]:
+            current = merged[-1]
+            if q0 + (current[1] + weight) / total <= q_limit:
+                current[0] += (mean - current[0]) * weight / (current[1] + weight)
+                current[1] += weight
+            else:
+                q0 += current[1] / total
+                q_limit = self._k_inverse(self._k(q0) + 1)
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        target = q * self.count
+        # Each centroid's mass is centred on its mean; interpolate between neighbours
+        cumulative = 0.0
+        previous_mean, previous_centre = self.min, 0.0
+        for mean, weight in self.centroids:
+            centre = cumulative + weight / 2
+            if target < centre:
+                span = centre - previous_centre
+                fraction = (target - previous_centre) / span if span else 0.0
+                return previous_mean + (mean - previous_mean) * fraction
+            cumulative += weight
+            previous_mean, previous_centre = mean, centre
+
+        span = self.count - previous_centre
+        fraction = (target - previous_centre) / span if span else 1.0
+        return previous_mean + (self.max - previous_mean) * min(1.0, fraction)
+
+    def to_bytes(self):
+        self._compress()
+        out = [self.HEADER.pack(self.VERSION, self.compression, len(self.centroids), self.min, self.max)]
+        out.append(struct.pack(f"<{2 * len(self.centroids)}f", *(v for centroid in self.centroids for v in centroid)))
+        return b"".join(out)
+
+    @classmethod
+    def from_bytes(cls, data, compression=100):
+        digest = cls(compression)
+        if not data:
+            return digest
+        version, stored_compression, n, low, high = cls.HEADER.unpack_from(data, 0)
+        if version != cls.VERSION:
+            return digest
+        digest.compression = stored_compression
+        values = struct.unpack_from(f"<{2 * n}f", data, cls.HEADER.size)
+        digest.centroids = [[values[i], values[i + 1]] for i in range(0, 2 * n, 2)]
+        digest.count = sum(w for _, w in digest.centroids)
+        digest.min, digest.max = low, high
+        return digest
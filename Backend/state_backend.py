@@ -0,0 +1,414 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+from admission import LocalBucketStore
+
+# Shared state for the risk path: velocity counters, the blacklist set, rate
+# limit buckets and read-version stamps. Every backend offers the same small
+# set of operations:
+#
+#   incr(key, amount, ttl)   -> new value      get(key) / get_many(keys) -> ints
+#   sadd / srem / sismember  -> set membership
+#   take(key, rate, burst)   -> (allowed, retry_after) token bucket
+#                               (a fixed window on redis, see RedisBackend.take)
+#
+# "memory" is private to one process; "shm" shares one mmap'd hash table
+# between all workers on a host; "redis" speaks the Redis protocol so workers
+# on several hosts agree.
+
+
+class StateBackendFull(RuntimeError):
+    pass
+
+
+class MemoryBackend:
+    name = "memory"
+    shared = False
+
+    def __init__(self):
+        self._values = {}
+        self._sets = {}
+        self._lock = threading.Lock()
+        self._buckets = LocalBucketStore()
+        self._writes = 0
+
+    def _live(self, key, now):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[1] and entry[1] < now:
+            del self._values[key]
+            return None
+        return entry
+
+    def _sweep(self, now):
+        # Expire lazily, plus a full pass every few thousand writes to bound memory
+        self._writes += 1
+        if self._writes % 5000 == 0:
+            for key in [k for k, (_, exp) in self._values.items() if exp and exp < now]:
+                del self._values[key]
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            value = (entry[0] if entry else 0) + amount
+            expires_at = (now + ttl) if ttl else (entry[1] if entry else 0)
+            self._values[key] = (value, expires_at)
+            self._sweep(now)
+            return value
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            return [(self._live(key, now) or (0, 0))[0] for key in keys]
+
+    def sadd(self, name, *members):
+        with self._lock:
+            self._sets.setdefault(name, set()).update(members)
+
+    def srem(self, name, member):
+        with self._lock:
+            self._sets.get(name, set()).discard(member)
+
+    def sismember(self, name, member):
+        return member in self._sets.get(name, ())
+
+    def take(self, key, rate, burst, cost=1.0):
+        return self._buckets.take(key, rate, burst, cost)
+
+
+class SharedMemoryBackend:
+    # Fixed-size open-addressing table in a memory-mapped file. Each slot is
+    # (key hash, value, expires_at); keys are stored as 64-bit hashes only.
+    # Every operation holds an exclusive flock, so all workers see one table.
+    #
+    # Short-TTL keys (velocity seconds, rate buckets, version stamps) churn
+    # constantly, so dead slots are handed back: a run of expired or deleted
+    # slots that ends in an EMPTY one is cleared whenever a probe walks into
+    # it, and once non-EMPTY slots pass MAX_LOAD the whole table is rehashed
+    # with only its live entries. Probes stop after MAX_PROBE slots. A rehash
+    # never drops a live entry: if one would not fit it is undone, and the
+    # write that needed room raises StateBackendFull.
+
+    name = "shm"
+    shared = True
+    MAGIC = b"GPSTATE2"
+    HEADER = struct.Struct("<8sQQ")   # magic, slots, non-EMPTY slots
+    SLOT = struct.Struct("<Qqd")
+    EMPTY, TOMBSTONE = 0, 1
+    MAX_LOAD = 0.6
+    MAX_PROBE = 256
+    COMPACT_INTERVAL = 1.0   # Seconds between rehashes by one process when the table stays loaded
+
+    def __init__(self, path, slots=1 << 20):
+        self.path = path
+        size = self.HEADER.size + slots * self.SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_lock = threading.Lock()
+        self.compactions = 0
+        self.failed_compactions = 0   # Rehashes undone because a live entry would not fit
+        self._compacted_at = 0.0
+
+        with self._locked():
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._mm = mmap.mmap(self._fd, 0)
+            magic, existing_slots, _ = self.HEADER.unpack_from(self._mm, 0)
+            if magic != self.MAGIC:
+                # New file, or one written by an older layout: start from an empty table
+                existing_slots = slots
+                self._mm[:size] = bytes(size)
+                self.HEADER.pack_into(self._mm, 0, self.MAGIC, slots, 0)
+        # The first process to create the file decides the table size
+        self.slots = existing_slots
+
+    def _locked(self):
+        backend = self
+
+        class _Lock:
+            def __enter__(self):
+                backend._thread_lock.acquire()
+                fcntl.flock(backend._fd, fcntl.LOCK_EX)
+
+            def __exit__(self, *exc):
+                fcntl.flock(backend._fd, fcntl.LOCK_UN)
+                backend._thread_lock.release()
+
+        return _Lock()
+
+    @staticmethod
+    def _hash(key):
+        h = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+        return h if h > 1 else h + 2
+
+    def _offset(self, index):
+        return self.HEADER.size + index * self.SLOT.size
+
+    def _used(self):
+        return self.HEADER.unpack_from(self._mm, 0)[2]
+
+    def _set_used(self, used):
+        struct.pack_into("<Q", self._mm, 16, used)
+
+    def _find(self, key, now):
+        # Returns (slot offset holding the key or None, first reusable offset)
+        h = self._hash(key)
+        reusable = None
+        dead_run = []   # Dead slots directly before the current probe position
+        for probe in range(min(self.MAX_PROBE, self.slots)):
+            offset = self._offset((h + probe) % self.slots)
+            slot_hash, value, expires_at = self.SLOT.unpack_from(self._mm, offset)
+            if slot_hash == self.EMPTY:
+                if dead_run:
+                    # Nothing can live behind an EMPTY slot, so the run goes back to EMPTY
+                    for dead in dead_run:
+                        self.SLOT.pack_into(self._mm, dead, self.EMPTY, 0, 0.0)
+                    self._set_used(self._used() - len(dead_run))
+                return None, reusable if reusable is not None else offset
+            expired = expires_at and expires_at < now
+            if slot_hash == h and not expired:
+                return offset, None
+            if slot_hash == self.TOMBSTONE or expired:
+                if reusable is None:
+                    reusable = offset
+                dead_run.append(offset)
+            else:
+                dead_run = []
+        return None, reusable
+
+    def _read(self, key, now):
+        offset, _ = self._find(key, now)
+        return self.SLOT.unpack_from(self._mm, offset)[1] if offset is not None else 0
+
+    def _write(self, key, value, ttl, now):
+        offset, free = self._find(key, now)
+        if offset is not None:
+            _, _, expires_at = self.SLOT.unpack_from(self._mm, offset)
+            self.SLOT.pack_into(self._mm, offset, self._hash(key), value, now + ttl if ttl else expires_at)
+            return
+        crowded = free is None or self._used() >= self.slots * self.MAX_LOAD
+        if crowded and time.monotonic() - self._compacted_at >= self.COMPACT_INTERVAL:
+            if self._compact(now):
+                _, free = self._find(key, now)
+        if free is None:
+            raise StateBackendFull(f"{self.path} has no free slot within {self.MAX_PROBE} probes ({self.slots} slots)")
+        if self.SLOT.unpack_from(self._mm, free)[0] == self.EMPTY:
+            self._set_used(self._used() + 1)
+        self.SLOT.pack_into(self._mm, free, self._hash(key), value, now + ttl if ttl else 0.0)
+
+    def _delete(self, key, now):
+        offset, _ = self._find(key, now)
+        if offset is not None:
+            self.SLOT.pack_into(self._mm, offset, self.TOMBSTONE, 0, 0.0)
+
+    def _compact(self, now):
+        # Rehash the live entries into a cleared table, dropping expired ones
+        # and tombstones. All or nothing: blacklist members and version stamps
+        # have no TTL, and losing one would fail open, so if any live entry
+        # finds no slot within MAX_PROBE the old table is put back.
+        start, end = self.HEADER.size, self._offset(self.slots)
+        before = self._mm[start:end]
+        live = [
+            (slot_hash, value, expires_at)
+            for slot_hash, value, expires_at in self.SLOT.iter_unpack(before)
+            if slot_hash > self.TOMBSTONE and not (expires_at and expires_at < now)
+        ]
+        self._mm[start:end] = bytes(end - start)
+        self._compacted_at = time.monotonic()
+        for slot_hash, value, expires_at in live:
+            for probe in range(min(self.MAX_PROBE, self.slots)):
+                offset = self._offset((slot_hash + probe) % self.slots)
+                if self.SLOT.unpack_from(self._mm, offset)[0] == self.EMPTY:
+                    self.SLOT.pack_into(self._mm, offset, slot_hash, value, expires_at)
+                    break
+            else:
+                self._mm[start:end] = before
+                self.failed_compactions += 1
+                return False
+        self._set_used(len(live))
+        self.compactions += 1
+        return True
+
+    def stats(self):
+        with self._locked():
+            return {"slots": self.slots, "used": self._used(), "compactions": self.compactions,
+                    "failed_compactions": self.failed_compactions}
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        with self._locked():
+            value = self._read(key, now) + amount
+            self._write(key, value, ttl, now)
+            return value
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._locked():
+            return [self._read(key, now) for key in keys]
+
+    def sadd(self, name, *members):
+        now = time.time()
+        with self._locked():
+            for member in members:
+                self._write(f"s\x00{name}\x00{member}", 1, None, now)
+
+    def srem(self, name, member):
+        with self._locked():
+            self._delete(f"s\x00{name}\x00{member}", time.time())
+
+    def sismember(self, name, member):
+        return self.get(f"s\x00{name}\x00{member}") == 1
+
+    def take(self, key, rate, burst, cost=1.0):
+        # Exact token bucket: tokens (in thousandths) and last refill (ms) live in two slots
+        now = time.time()
+        ttl = burst / rate + 60
+        with self._locked():
+            tokens = self._read(key + ":t", now) / 1000.0
+            updated_ms = self._read(key + ":u", now)
+            if not updated_ms:
+                tokens = burst
+            else:
+                tokens = min(burst, tokens + (now - updated_ms / 1000.0) * rate)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._write(key + ":t", int(tokens * 1000), ttl, now)
+            self._write(key + ":u", int(now * 1000), ttl, now)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+class RedisError(RuntimeError):
+    pass
+
+
+class RedisBackend:
+    # Minimal RESP2 client: one socket per thread, commands pipelined where it
+    # saves a round-trip. Works against Redis, Valkey, KeyDB or any stand-in
+    # that speaks the protocol.
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url, timeout=1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+            if self.password:
+                self._pipeline([("AUTH", self.password)])
+            if self.db:
+                self._pipeline([("SELECT", self.db)])
+        return conn
+
+    @staticmethod
+    def _encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)[:-2]
+            return data.decode()
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [self._read_reply(reader) for _ in range(length)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    def _pipeline(self, commands):
+        sock, reader = self._connection()
+        try:
+            sock.sendall(b"".join(self._encode(c) for c in commands))
+            return [self._read_reply(reader) for _ in commands]
+        except (OSError, ConnectionError):
+            # Drop the broken socket so the next call reconnects
+            self._local.conn = None
+            raise
+
+    def incr(self, key, amount=1, ttl=None):
+        commands = [("INCRBY", key, amount)]
+        if ttl:
+            commands.append(("EXPIRE", key, int(ttl + 0.999)))
+        return self._pipeline(commands)[0]
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        return [int(v) if v is not None else 0 for v in self._pipeline([("MGET", *keys)])[0]]
+
+    def sadd(self, name, *members):
+        if members:
+            self._pipeline([("SADD", name, *members)])
+
+    def srem(self, name, member):
+        self._pipeline([("SREM", name, member)])
+
+    def sismember(self, name, member):
+        return self._pipeline([("SISMEMBER", name, member)])[0] == 1
+
+    def take(self, key, rate, burst, cost=1.0):
+        # Deliberately not a token bucket: a fixed window of burst/rate seconds
+        # needs only INCR + EXPIRE, one pipelined round-trip and no scripting.
+        # The price is that a client can get up to 2 x burst across a window
+        # edge; the average rate is the same.
+        window = max(1.0, burst / rate)
+        now = time.time()
+        slot = int(now // window)
+        count = self.incr(f"{key}:{slot}", int(cost), ttl=window + 1)
+        if count <= burst:
+            return True, 0.0
+        return False, (slot + 1) * window - now
+
+
+def create_state_backend(kind, shm_path=None, shm_slots=1 << 20, redis_url=None):
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "shm":
+        return SharedMemoryBackend(shm_path, shm_slots)
+    if kind == "redis":
+        return RedisBackend(redis_url)
+    raise ValueError(f"Unknown STATE_BACKEND {kind!r} (expected memory, shm or redis)")
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py reads its settings when imported; the tests that need the app share
+# one throwaway SQLite file and the per-process state backend
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="guardpay-tests-"), "guardpay.db"))
+os.environ.setdefault("ARCHIVE_DIR", tempfile.mkdtemp(prefix="guardpay-archive-"))
+os.environ["STATE_BACKEND"] = "memory"
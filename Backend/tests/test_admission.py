@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import ConcurrencyLimiter, LocalBucketStore, RateLimiter, parse_limit, retry_after_header  # noqa: E402
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patch = mock.patch("admission.time.monotonic", lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.store = LocalBucketStore()
+
+    def test_burst_then_refill_at_rate(self):
+        results = [self.store.take("ip:1", 2, 5)[0] for _ in range(6)]
+        self.assertEqual(results, [True] * 5 + [False])
+
+        allowed, retry_after = self.store.take("ip:1", 2, 5)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 0.5)
+
+        self.now += 0.5
+        self.assertTrue(self.store.take("ip:1", 2, 5)[0])
+        self.assertFalse(self.store.take("ip:1", 2, 5)[0])
+
+    def test_refill_never_exceeds_burst(self):
+        for _ in range(5):
+            self.store.take("ip:1", 2, 5)
+        self.now += 3600
+        results = [self.store.take("ip:1", 2, 5)[0] for _ in range(6)]
+        self.assertEqual(results.count(True), 5)
+
+    def test_keys_are_independent_and_oldest_are_forgotten(self):
+        store = LocalBucketStore(max_keys=2)
+        self.assertTrue(store.take("a", 1, 1)[0])
+        self.assertFalse(store.take("a", 1, 1)[0])
+        self.assertTrue(store.take("b", 1, 1)[0])
+        store.take("c", 1, 1)
+        # "a" was evicted, and a forgotten bucket starts full again
+        self.assertTrue(store.take("a", 1, 1)[0])
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_rejections_are_counted_per_scope(self):
+        limiter = RateLimiter(LocalBucketStore())
+        limiter.check("ip", "1.2.3.4", 1, 1)
+        allowed, retry_after = limiter.check("ip", "1.2.3.4", 1, 1)
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+        self.assertTrue(limiter.check("user", "1.2.3.4", 1, 1)[0])
+        self.assertEqual(limiter.rejected, {"ip": 1})
+
+    def test_zero_rate_disables_the_limit(self):
+        limiter = RateLimiter(LocalBucketStore())
+        self.assertTrue(all(limiter.check("ip", "x", 0, 0)[0] for _ in range(100)))
+
+
+class ConcurrencyLimiterTest(unittest.TestCase):
+    def test_rejects_above_the_cap(self):
+        limiter = ConcurrencyLimiter(2)
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.release()
+        self.assertTrue(limiter.try_acquire())
+        self.assertEqual((limiter.in_flight, limiter.peak, limiter.rejected), (2, 2, 1))
+
+    def test_zero_means_unlimited(self):
+        limiter = ConcurrencyLimiter(0)
+        self.assertTrue(all(limiter.try_acquire() for _ in range(100)))
+
+
+class ParsingTest(unittest.TestCase):
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit("5/10"), (5.0, 10.0))
+        self.assertEqual(parse_limit("20"), (20.0, 20.0))
+        self.assertEqual(parse_limit("0.5"), (0.5, 1.0))
+        self.assertEqual(parse_limit("0")[0], 0.0)
+
+    def test_retry_after_rounds_up_to_whole_seconds(self):
+        self.assertEqual(retry_after_header(0.0), "1")
+        self.assertEqual(retry_after_header(1.2), "2")
+        self.assertEqual(retry_after_header(3.0), "3")
+
+
+if __name__ == "__main__":
+    unittest.main()
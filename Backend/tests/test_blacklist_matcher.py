@@ -0,0 +1,95 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blacklist_matcher import ImportBatch, LineSplitter, PatternMatcher, classify  # noqa: E402
+
+
+class PatternMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.matcher = PatternMatcher([
+            ("prefix", "scam"), ("prefix", "scammer.pay"),
+            ("suffix", "@fakepsp"), ("suffix", "bank"),
+        ])
+
+    def test_prefix_and_suffix_rules(self):
+        self.assertEqual(self.matcher.match("scamking@upi"), ("prefix", "scam"))
+        self.assertEqual(self.matcher.match("alice@fakepsp"), ("suffix", "@fakepsp"))
+        self.assertEqual(self.matcher.match("alice@goodbank"), ("suffix", "bank"))
+        self.assertIsNone(self.matcher.match("alice@upi"))
+
+    def test_patterns_only_match_at_their_end_of_the_id(self):
+        self.assertIsNone(self.matcher.match("notascam@upi"))
+        self.assertIsNone(self.matcher.match("bank.alice@upi"))
+        self.assertIsNone(self.matcher.match("sca"))
+
+    def test_shortest_prefix_wins_and_duplicates_count_once(self):
+        self.assertEqual(self.matcher.match("scammer.pay@upi"), ("prefix", "scam"))
+        self.matcher.add("prefix", "scam")
+        self.assertEqual(self.matcher.size, 4)
+
+    def test_case_insensitive(self):
+        self.assertEqual(self.matcher.match("SCAMKING@UPI"), ("prefix", "scam"))
+        self.assertEqual(self.matcher.match("Alice@FakePSP"), ("suffix", "@fakepsp"))
+
+    def test_classify(self):
+        self.assertEqual(classify("Scam*"), ("prefix", "scam"))
+        self.assertEqual(classify("*@FakePSP"), ("suffix", "@fakepsp"))
+        self.assertEqual(classify("@fakepsp"), ("suffix", "@fakepsp"))
+        self.assertEqual(classify("Bob@UPI"), ("exact", "Bob@UPI"))
+        self.assertEqual(classify("bob*", "exact"), ("exact", "bob"))
+        for bad in ("", "*", "*both*", "has space", "x" * 300):
+            self.assertIsNone(classify(bad), bad)
+
+
+class ImportBatchTest(unittest.TestCase):
+    def feed(self, batch, data, max_bytes=4096, chunk_size=7):
+        lines = LineSplitter(max_bytes)
+        for start in range(0, len(data), chunk_size):
+            for line in lines.feed(data[start:start + chunk_size]):
+                batch.feed(line)
+        for line in lines.finish():
+            batch.feed(line)
+        return batch
+
+    def test_csv_with_header_and_invalid_lines(self):
+        data = b"\xef\xbb\xbfupi_id,reason,kind\nscam*,Feed A\n\nbad id,x\nbob@upi,,exact\n@psp"
+        batch = self.feed(ImportBatch("auto", "Default", 100), data)
+        self.assertEqual(batch.fmt, "csv")
+        self.assertEqual(batch.entries, [
+            ("prefix", "scam", "Feed A"), ("exact", "bob@upi", "Default"), ("suffix", "@psp", "Default"),
+        ])
+        self.assertEqual((batch.lines, batch.invalid), (6, 1))
+
+    def test_ndjson(self):
+        data = b'{"upi_id": "mule@upi", "reason": "Mule"}\n{"pattern": "*@fake", "kind": "suffix"}\n[1]\n'
+        batch = self.feed(ImportBatch("auto", "Default", 100), data)
+        self.assertEqual(batch.fmt, "ndjson")
+        self.assertEqual(batch.entries, [("exact", "mule@upi", "Mule"), ("suffix", "@fake", "Default")])
+        self.assertEqual(batch.invalid, 1)
+
+    def test_full_batches(self):
+        batch = ImportBatch("csv", "Default", 2)
+        self.assertFalse(batch.feed(b"a@upi"))
+        self.assertTrue(batch.feed(b"b@upi"))
+        self.assertEqual(len(batch.take()), 2)
+        self.assertEqual(batch.entries, [])
+
+    def test_oversized_lines_are_skipped_without_buffering(self):
+        lines = LineSplitter(16)
+        self.assertEqual(lines.feed(b"a@upi\n" + b"x" * 10), [b"a@upi"])
+        self.assertEqual(lines.feed(b"y" * 1000), [])
+        self.assertEqual(lines._parts, [])
+        self.assertEqual(lines.feed(b"z\nb@upi"), [None])
+        self.assertEqual(lines.finish(), [b"b@upi"])
+
+        data = b"a@upi\n" + b"x" * 10_000 + b"\nb@upi\n" + b"y" * 10_000
+        batch = self.feed(ImportBatch("csv", "Default", 100), data, max_bytes=4096, chunk_size=1000)
+        self.assertEqual([value for _, value, _ in batch.entries], ["a@upi", "b@upi"])
+        self.assertEqual((batch.lines, batch.invalid), (4, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
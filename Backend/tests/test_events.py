@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from events import EventBus, sse_message  # noqa: E402
+
+
+class EventBusTest(unittest.IsolatedAsyncioTestCase):
+    async def test_subscriber_gets_events_in_order(self):
+        bus = EventBus()
+        subscription = bus.subscribe()
+        bus.publish("decision", {"decision": "APPROVED"})
+        bus.publish("stats", {"deltas": {"approved": 1}})
+
+        events, dropped = await subscription.next_batch(1)
+        self.assertEqual([e["type"] for e in events], ["decision", "stats"])
+        self.assertEqual([e["id"] for e in events], [1, 2])
+        self.assertEqual(events[0]["decision"], "APPROVED")
+        self.assertEqual(dropped, 0)
+
+    async def test_slow_subscriber_drops_oldest(self):
+        bus = EventBus(buffer_size=3)
+        subscription = bus.subscribe()
+        for i in range(5):
+            bus.publish("tick", {"n": i})
+        events, dropped = await subscription.next_batch(1)
+        self.assertEqual([e["n"] for e in events], [2, 3, 4])
+        self.assertEqual(dropped, 2)
+        self.assertEqual(subscription.dropped, 0)
+
+    async def test_publish_from_a_worker_thread_wakes_the_subscriber(self):
+        bus = EventBus()
+        subscription = bus.subscribe()
+        timer = threading.Timer(0.05, bus.publish, ("decision", {}))
+        timer.start()
+        events, _ = await subscription.next_batch(2)
+        timer.join()
+        self.assertEqual(len(events), 1)
+
+    async def test_timeout_returns_an_empty_batch(self):
+        subscription = EventBus().subscribe()
+        self.assertEqual(await subscription.next_batch(0.01), ([], 0))
+
+    async def test_closed_subscription_stops_receiving(self):
+        bus = EventBus()
+        subscription = bus.subscribe()
+        subscription.close()
+        bus.publish("decision", {})
+        self.assertEqual(bus.stats(), {"subscribers": 0, "published": 1})
+        self.assertEqual(await subscription.next_batch(0.01), ([], 0))
+
+    async def test_failing_listener_does_not_break_publish(self):
+        bus = EventBus()
+        seen = []
+        bus.add_listener(lambda event: 1 / 0)
+        bus.add_listener(seen.append)
+        subscription = bus.subscribe()
+        with self.assertLogs("guardpay", "ERROR"):
+            bus.publish("decision", {})
+        self.assertEqual(len(seen), 1)
+        self.assertEqual(len((await subscription.next_batch(1))[0]), 1)
+
+
+class SSEMessageTest(unittest.TestCase):
+    def test_format(self):
+        message = sse_message("decision", {"amount": 10.5, "ok": True}, event_id=7)
+        self.assertTrue(message.endswith(b"\n\n"))
+        lines = message.decode().strip().split("\n")
+        self.assertEqual(lines[:2], ["id: 7", "event: decision"])
+        self.assertEqual(json.loads(lines[2][len("data: "):]), {"amount": 10.5, "ok": True})
+        self.assertFalse(sse_message("ping", {}).startswith(b"id:"))
+
+
+class CommitPublishingTest(unittest.TestCase):
+    # Events queued on a session are only published once it commits
+
+    @classmethod
+    def setUpClass(cls):
+        main.prepare_schema()
+
+    def setUp(self):
+        self.published = []
+        main.event_bus.add_listener(self.published.append)
+        self.addCleanup(main.event_bus._listeners.remove, self.published.append)
+
+    def test_rollback_discards_queued_events(self):
+        marker = uuid.uuid4().hex
+        db = main.SessionLocal()
+        try:
+            db.query(main.UserDB).count()
+            main.queue_event(db, "user", {"marker": marker})
+            db.rollback()
+            db.query(main.UserDB).count()
+            main.queue_event(db, "user", {"marker": marker, "committed": True})
+            db.commit()
+        finally:
+            db.close()
+        mine = [e for e in self.published if e.get("marker") == marker]
+        self.assertEqual([e.get("committed") for e in mine], [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
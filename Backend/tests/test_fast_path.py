@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+
+class FastPathTest(unittest.TestCase):
+    # The lifespan is not started, so the background writer never races the
+    # test; settle_fast_approvals and recover_fast_approvals are called directly
+
+    @classmethod
+    def setUpClass(cls):
+        main.prepare_schema()
+        cls.client = TestClient(main.app)
+
+    def setUp(self):
+        self.username = f"trusted-{uuid.uuid4().hex[:8]}"
+        self.assertEqual(self.client.post("/signup", json={"username": self.username, "password": "pw"}).status_code, 200)
+        self.set_user(aura_score=95.0, total_tx_count=60, avg_tx_amount=500.0, std_dev_amount=100.0)
+        self.enabled = main.TRUSTED_FAST_PATH
+        main.TRUSTED_FAST_PATH = True
+        main.fast_path.drain()
+
+    def tearDown(self):
+        main.TRUSTED_FAST_PATH = self.enabled
+
+    def set_user(self, **values):
+        db = main.SessionLocal()
+        db.query(main.UserDB).filter(main.UserDB.username == self.username).update(values)
+        db.commit()
+        db.close()
+        main.user_state.discard(self.username)
+
+    def transfer(self, amount=300.0, key=None):
+        return self.client.post(
+            "/safe-transfer",
+            json={"sender_username": self.username, "recipient_upi": "shop@upi", "amount": amount},
+            headers={"Idempotency-Key": key or str(uuid.uuid4())},
+        ).json()
+
+    def count(self, model, **filters):
+        db = main.SessionLocal()
+        try:
+            return db.query(model).filter_by(**filters).count()
+        finally:
+            db.close()
+
+    def user(self):
+        db = main.SessionLocal()
+        try:
+            return db.query(main.UserDB).filter(main.UserDB.username == self.username).one()
+        finally:
+            db.close()
+
+    def test_eligible_transfer_is_durable_before_it_is_settled(self):
+        key = str(uuid.uuid4())
+        fast_before = main.fast_path.fast
+        self.assertEqual(self.transfer(key=key)["status"], "SUCCESS")
+        self.assertEqual(main.fast_path.fast, fast_before + 1)
+        self.assertEqual(self.count(main.FastPathOutboxDB, idempotency_key=key), 1)
+        self.assertEqual(self.count(main.TransactionLogDB, idempotency_key=key), 0)
+
+        main.settle_fast_approvals()
+        self.assertEqual(self.count(main.FastPathOutboxDB, idempotency_key=key), 0)
+        self.assertEqual(self.count(main.TransactionLogDB, idempotency_key=key, state=main.TransactionState.APPROVED), 1)
+
+    def test_ineligible_senders_take_the_full_path(self):
+        for values, amount in (({"warning_count": 1}, 300.0), ({"aura_score": 80.0}, 300.0), ({}, 900.0)):
+            self.set_user(**{"aura_score": 95.0, "warning_count": 0, **values})
+            full_before = main.fast_path.full
+            key = str(uuid.uuid4())
+            self.transfer(amount=amount, key=key)
+            self.assertEqual(main.fast_path.full, full_before + 1, values or amount)
+            self.assertEqual(self.count(main.FastPathOutboxDB, idempotency_key=key), 0)
+
+    def test_disagreement_claws_back_and_is_counted(self):
+        sender = main.load_user_state(main.SessionLocal(), self.username)
+        request = main.TransferRequest(sender_username=self.username, recipient_upi="shop@upi", amount=300.0)
+        # Threshold 0: whatever the full rules score, they would have blocked it
+        approval = main.PendingApproval(request, sender, str(uuid.uuid4()), 0, (0, 0), time.time(), 1.0)
+        db = main.SessionLocal()
+        db.add(main.outbox_row(approval))
+        db.commit()
+        db.close()
+        main.fast_path.offer(approval)
+        verified, disagreements = main.fast_path.verified, main.fast_path.disagreements
+
+        main.settle_fast_approvals()
+        user = self.user()
+        self.assertEqual(user.aura_score, 95.0 - main.TRUSTED_FAST_PATH_CLAWBACK)
+        self.assertEqual(user.warning_count, 1)
+        self.assertEqual(main.fast_path.verified, verified + 1)
+        self.assertEqual(main.fast_path.disagreements, disagreements + 1)
+        self.assertGreater(main.fast_path.stats()["disagreement_rate"], 0)
+        # The warning keeps the account off the fast path
+        full_before = main.fast_path.full
+        self.transfer()
+        self.assertEqual(main.fast_path.full, full_before + 1)
+
+    def test_approval_lost_with_its_worker_is_recovered_once(self):
+        key = str(uuid.uuid4())
+        self.assertEqual(self.transfer(key=key)["status"], "SUCCESS")
+        main.fast_path.drain()   # The worker dies with the approval still queued
+
+        db = main.SessionLocal()
+        db.query(main.FastPathOutboxDB).filter(main.FastPathOutboxDB.idempotency_key == key).update(
+            {main.FastPathOutboxDB.claimed_at: time.time() - main.TRUSTED_FAST_PATH_RECOVER_SECONDS - 1}
+        )
+        db.commit()
+        db.close()
+        main.recover_fast_approvals()
+        main.recover_fast_approvals()   # Already claimed: not queued twice
+        main.settle_fast_approvals()
+        self.assertEqual(self.count(main.TransactionLogDB, idempotency_key=key), 1)
+        self.assertEqual(self.count(main.FastPathOutboxDB, idempotency_key=key), 0)
+
+    def test_settling_twice_writes_one_log(self):
+        key = str(uuid.uuid4())
+        self.transfer(key=key)
+        (approval,) = main.fast_path.drain()
+        twin = main.PendingApproval(approval.request, approval.sender, key, approval.threshold, approval.velocity, approval.epoch, 1.0)
+        main.settle_fast_approval(approval)
+        main.settle_fast_approval(twin)
+        self.assertEqual(self.count(main.TransactionLogDB, idempotency_key=key), 1)
+
+    def test_sender_deleted_before_settling_keeps_the_audit_log(self):
+        key = str(uuid.uuid4())
+        self.transfer(key=key)
+        db = main.SessionLocal()
+        db.query(main.UserDB).filter(main.UserDB.username == self.username).delete()
+        db.commit()
+        db.close()
+        main.user_state.discard(self.username)
+        main.settle_fast_approvals()
+        self.assertEqual(main.fast_path.stats()["pending"], 0)
+        self.assertEqual(self.count(main.TransactionLogDB, idempotency_key=key), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
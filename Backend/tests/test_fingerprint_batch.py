@@ -0,0 +1,116 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from fingerprint_batch import FingerprintAccumulator, recompute_fingerprints  # noqa: E402
+
+
+class FingerprintAccumulatorTest(unittest.TestCase):
+    def test_merged_chunks_match_a_single_pass(self):
+        rng = random.Random(3)
+        rows = [(f"u{rng.randrange(2000)}", rng.uniform(1, 5000)) for _ in range(20000)]
+        accumulator = FingerprintAccumulator(capacity=4)   # Forces several grows
+
+        for start in range(0, len(rows), 3000):
+            chunk = rows[start:start + 3000]
+            names = sorted({name for name, _ in chunk})
+            amounts = {name: [a for n, a in chunk if n == name] for name in names}
+            accumulator.merge(
+                names,
+                np.array([len(amounts[n]) for n in names]),
+                np.array([np.mean(amounts[n]) for n in names]),
+                np.array([np.sum((np.array(amounts[n]) - np.mean(amounts[n])) ** 2) for n in names]),
+            )
+
+        by_user = {}
+        for name, amount in rows:
+            by_user.setdefault(name, []).append(amount)
+        result = {name: (count, mean, std_dev) for name, count, mean, _, std_dev in accumulator.rows()}
+        self.assertEqual(set(result), set(by_user))
+        for name, amounts in by_user.items():
+            count, mean, std_dev = result[name]
+            self.assertEqual(count, len(amounts))
+            self.assertAlmostEqual(mean, np.mean(amounts), places=6)
+            self.assertAlmostEqual(std_dev, np.std(amounts), places=6)
+
+    def test_empty_partials_are_ignored(self):
+        accumulator = FingerprintAccumulator()
+        accumulator.merge([], np.empty(0, np.int64), np.empty(0), np.empty(0))
+        self.assertEqual(list(accumulator.rows()), [])
+
+
+class RecomputeFingerprintsTest(unittest.TestCase):
+    # Runs against its own SQLite file so the parallel path can open it from worker processes
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.engine = create_engine(f"sqlite:///{self.dir.name}/fingerprints.db")
+        self.addCleanup(self.engine.dispose)
+        main.Base.metadata.create_all(self.engine)
+
+        rng = random.Random(5)
+        self.amounts = {f"user{i}": [] for i in range(6)}
+        with Session(self.engine) as db:
+            for username in self.amounts:
+                db.add(main.UserDB(username=username, hashed_password="x", total_tx_count=99, avg_tx_amount=1.0))
+                db.add(main.UserRiskFeaturesDB(username=username, approved_count=99))
+            db.add(main.UserDB(username="idle", hashed_password="x", total_tx_count=7, avg_tx_amount=5.0))
+            db.add(main.UserRiskFeaturesDB(username="idle", approved_count=7))
+            for i in range(500):
+                username = f"user{rng.randrange(5)}"
+                approved = rng.random() < 0.8
+                amount = round(rng.uniform(10, 2000), 2)
+                db.add(main.TransactionLogDB(
+                    idempotency_key=f"k{i}", username=username, recipient="shop@upi", amount=amount, type="PAYMENT",
+                    state=main.TransactionState.APPROVED if approved else main.TransactionState.BLOCKED,
+                ))
+                if approved:
+                    self.amounts[username].append(amount)
+            db.commit()
+
+    def recompute(self, workers):
+        return recompute_fingerprints(
+            self.engine, main.TransactionLogDB.__table__, main.UserDB.__table__, main.UserRiskFeaturesDB.__table__,
+            main.TransactionState.APPROVED, workers=workers, chunk_rows=64, batch_size=2,
+        )
+
+    def assert_fingerprints(self):
+        with Session(self.engine) as db:
+            users = {u.username: u for u in db.query(main.UserDB)}
+            features = {f.username: f for f in db.query(main.UserRiskFeaturesDB)}
+        for username, amounts in self.amounts.items():
+            self.assertEqual(users[username].total_tx_count, len(amounts))
+            self.assertEqual(features[username].approved_count, len(amounts))
+            if amounts:
+                self.assertAlmostEqual(users[username].avg_tx_amount, np.mean(amounts), places=6)
+                self.assertAlmostEqual(users[username].std_dev_amount, np.std(amounts), places=6)
+            else:
+                self.assertEqual(users[username].avg_tx_amount, 0.0)
+        # Users without approved logs are reset rather than left stale
+        self.assertEqual((users["idle"].total_tx_count, features["idle"].approved_count), (0, 0))
+
+    def test_single_process(self):
+        result = self.recompute(workers=1)
+        self.assertEqual(result["rows_scanned"], sum(len(a) for a in self.amounts.values()))
+        self.assertEqual(result["users_with_history"], 5)
+        self.assert_fingerprints()
+
+    def test_worker_processes_give_the_same_result(self):
+        result = self.recompute(workers=2)
+        self.assertGreater(result["chunks"], 1)
+        self.assertEqual(result["workers"], 2)
+        self.assert_fingerprints()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+import time
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from idempotency import InFlightRegistry  # noqa: E402
+
+
+class InFlightRegistryTest(unittest.TestCase):
+    def test_first_claim_owns_and_duplicates_get_its_body(self):
+        registry = InFlightRegistry()
+        entry, owner = registry.claim("k")
+        self.assertTrue(owner)
+        duplicate, owner = registry.claim("k")
+        self.assertFalse(owner)
+        self.assertIs(duplicate, entry)
+        self.assertEqual(registry.stats()["in_flight"], 1)
+
+        threading.Timer(0.05, registry.finish, ("k", b'{"ok":true}')).start()
+        self.assertEqual(duplicate.wait(2), b'{"ok":true}')
+        self.assertEqual(registry.stats()["in_flight"], 0)
+        # The key is free again once answered
+        self.assertTrue(registry.claim("k")[1])
+
+    def test_release_wakes_waiters_without_a_body(self):
+        registry = InFlightRegistry()
+        registry.claim("k")
+        duplicate, _ = registry.claim("k")
+        registry.release("k")
+        self.assertIsNone(duplicate.wait(1))
+        self.assertTrue(registry.claim("k")[1])
+
+    def test_wait_times_out(self):
+        registry = InFlightRegistry()
+        registry.claim("k")
+        duplicate, _ = registry.claim("k")
+        started = time.monotonic()
+        self.assertIsNone(duplicate.wait(0.05))
+        self.assertLess(time.monotonic() - started, 1)
+
+
+class CoalescingTest(unittest.TestCase):
+    # handle_idempotency as two concurrent requests with the same key would call it
+
+    @classmethod
+    def setUpClass(cls):
+        main.prepare_schema()
+
+    def test_duplicate_waits_for_the_owner_and_replays_its_answer(self):
+        key = str(uuid.uuid4())
+        owner_db, duplicate_db = main.SessionLocal(), main.SessionLocal()
+        self.addCleanup(owner_db.close)
+        self.addCleanup(duplicate_db.close)
+        coalesced = main.idempotency_inflight.coalesced
+
+        self.assertIsNone(main.handle_idempotency(owner_db, key, "/test"))
+        replies = []
+        duplicate = threading.Thread(target=lambda: replies.append(main.handle_idempotency(duplicate_db, key, "/test")))
+        duplicate.start()
+        time.sleep(0.1)
+        self.assertEqual(replies, [])
+
+        main.store_idempotent_response(owner_db, key, "/test", {"message": "done"}, main.MessageResponse)
+        duplicate.join(5)
+        self.assertEqual(replies[0].body, b'{"message":"done"}')
+        self.assertEqual(main.idempotency_inflight.coalesced, coalesced + 1)
+
+    def test_owner_failure_lets_the_next_request_run(self):
+        key = str(uuid.uuid4())
+        db = main.SessionLocal()
+        self.addCleanup(db.close)
+        self.assertIsNone(main.handle_idempotency(db, key, "/test"))
+        main.release_idempotency_claims(db, db.info.pop("idempotency_claims"))
+
+        retry_db = main.SessionLocal()
+        self.addCleanup(retry_db.close)
+        self.assertIsNone(main.handle_idempotency(retry_db, key, "/test"))
+        main.release_idempotency_claims(retry_db, retry_db.info.pop("idempotency_claims"))
+
+    def test_duplicate_gets_409_when_the_owner_is_too_slow(self):
+        key = str(uuid.uuid4())
+        owner_db, duplicate_db = main.SessionLocal(), main.SessionLocal()
+        self.addCleanup(owner_db.close)
+        self.addCleanup(duplicate_db.close)
+        self.assertIsNone(main.handle_idempotency(owner_db, key, "/test"))
+        self.addCleanup(main.release_idempotency_claims, owner_db, {key})
+
+        saved = main.IDEMPOTENCY_WAIT_SECONDS
+        main.IDEMPOTENCY_WAIT_SECONDS = 0.05
+        self.addCleanup(setattr, main, "IDEMPOTENCY_WAIT_SECONDS", saved)
+        with self.assertRaises(main.HTTPException) as raised:
+            main.handle_idempotency(duplicate_db, key, "/test")
+        self.assertEqual(raised.exception.status_code, 409)
+        self.assertEqual(raised.exception.headers["Retry-After"], "1")
+
+
+class IdempotentReplayTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        main.prepare_schema()
+        cls.client = TestClient(main.app)
+
+    def setUp(self):
+        self.username = f"replay-{uuid.uuid4().hex[:8]}"
+        self.assertEqual(self.client.post("/signup", json={"username": self.username, "password": "pw"}).status_code, 200)
+
+    def transfer(self, key):
+        return self.client.post(
+            "/safe-transfer",
+            json={"sender_username": self.username, "recipient_upi": "shop@upi", "amount": 120.0},
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_answer_is_stored_as_bytes_and_replayed_verbatim(self):
+        key = str(uuid.uuid4())
+        first = self.transfer(key)
+        self.assertEqual(first.status_code, 200)
+
+        db = main.SessionLocal()
+        try:
+            stored = db.query(main.IdempotencyLogDB.response_body).filter(
+                main.IdempotencyLogDB.idempotency_key == key
+            ).scalar()
+        finally:
+            db.close()
+        self.assertIsInstance(stored, bytes)
+        self.assertEqual(stored, first.content)
+
+        replay = self.transfer(key)
+        self.assertEqual(replay.content, first.content)
+        self.assertEqual(replay.headers["content-type"], "application/json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_archive import ARCHIVE_SUFFIX, ArchiveStore, write_archive  # noqa: E402
+
+
+def rows(count, recipient="shop@upi"):
+    return [
+        {
+            "id": i, "idempotency_key": f"k{i}", "username": f"user{i % 3}", "recipient": recipient,
+            "amount": 10.0 * i, "type": "PAYMENT", "state": "APPROVED", "timestamp": datetime(2024, 1, 1 + i % 28),
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+class ArchiveStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "2024-01" + ARCHIVE_SUFFIX)
+        self.store = ArchiveStore(self.dir.name)
+
+    def rewrite(self, data):
+        write_archive(self.path, data)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    def test_history_and_summary(self):
+        write_archive(self.path, rows(30))
+        history = self.store.history("user1")
+        self.assertEqual([r["id"] for r in history], sorted((i for i in range(1, 31) if i % 3 == 1), key=lambda i: (1 + i % 28, i)))
+        self.assertEqual(self.store.summary()["row_count"], 30)
+
+    def test_rewritten_file_is_not_closed_under_a_reader_in_use(self):
+        write_archive(self.path, rows(30))
+        with self.store.readers() as held:
+            (old,) = held
+            self.rewrite(rows(31, recipient="other@upi"))
+            # Another request sees the new file while the first is still reading the old one
+            self.assertEqual(self.store.summary()["row_count"], 31)
+            self.assertTrue(old.retired)
+            self.assertFalse(old._mm.closed)
+            self.assertEqual(next(old.rows(range(1)))["recipient"], "shop@upi")
+        self.assertTrue(old._mm.closed)
+
+    def test_unused_reader_is_closed_when_its_file_changes(self):
+        write_archive(self.path, rows(5))
+        with self.store.readers() as held:
+            (old,) = held
+        self.rewrite(rows(6))
+        with self.store.readers() as held:
+            self.assertIsNot(held[0], old)
+        self.assertTrue(old._mm.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
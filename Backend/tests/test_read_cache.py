@@ -0,0 +1,111 @@
+import os
+import sys
+import unittest
+import uuid
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from read_cache import ResponseCache, VersionStamps, etag_matches  # noqa: E402
+from state_backend import MemoryBackend  # noqa: E402
+
+
+class VersionStampsTest(unittest.TestCase):
+    def setUp(self):
+        self.stamps = VersionStamps(MemoryBackend())
+        self.stamps.ensure_epoch()
+
+    def test_bump_changes_the_etag(self):
+        before = self.stamps.etag("alice")
+        versions = self.stamps.bump("alice", None)
+        self.assertEqual(list(versions), ["alice"])
+        self.assertNotEqual(self.stamps.etag("alice"), before)
+        self.assertEqual(self.stamps.version("alice"), versions["alice"])
+        self.assertTrue(self.stamps.etag("alice").startswith('W/"'))
+
+    def test_fresh_versions_start_from_the_clock(self):
+        # A key that expired must not count up through versions clients still hold
+        with mock.patch("read_cache.time.time", return_value=1_700_000_000.0):
+            first = self.stamps.bump("bob")["bob"]
+            self.assertGreater(first, 1_700_000_000_000)
+            self.assertEqual(self.stamps.bump("bob")["bob"], first + 1)
+
+    def test_epoch_is_kept_once_set(self):
+        epoch = self.stamps.backend.get("ver:epoch")
+        self.assertGreater(epoch, 0)
+        self.stamps.ensure_epoch()
+        self.assertEqual(self.stamps.backend.get("ver:epoch"), epoch)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patch = mock.patch("read_cache.time.monotonic", lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_hit_only_for_the_same_etag_within_ttl(self):
+        cache = ResponseCache(ttl_seconds=5, max_entries=10)
+        cache.put("/profile/a", 'W/"1-1"', b"{}")
+        self.assertEqual(cache.get("/profile/a", 'W/"1-1"'), b"{}")
+        self.assertIsNone(cache.get("/profile/a", 'W/"1-2"'))
+        self.now += 6
+        self.assertIsNone(cache.get("/profile/a", 'W/"1-1"'))
+        self.assertEqual(cache.stats(), {"entries": 1, "hits": 1, "misses": 2})
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResponseCache(ttl_seconds=5, max_entries=2)
+        cache.put("a", "e", b"a")
+        cache.put("b", "e", b"b")
+        cache.get("a", "e")
+        cache.put("c", "e", b"c")
+        self.assertIsNone(cache.get("b", "e"))
+        self.assertEqual(cache.get("a", "e"), b"a")
+
+    def test_zero_ttl_disables_caching(self):
+        cache = ResponseCache(ttl_seconds=0, max_entries=2)
+        cache.put("a", "e", b"a")
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('W/"1-2"', 'W/"1-2"'))
+        self.assertTrue(etag_matches('W/"1-1", W/"1-2"', 'W/"1-2"'))
+        self.assertTrue(etag_matches("*", 'W/"1-2"'))
+        self.assertFalse(etag_matches(None, 'W/"1-2"'))
+        self.assertFalse(etag_matches('W/"1-1"', 'W/"1-2"'))
+
+
+class ConditionalReadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        main.prepare_schema()
+        main.user_versions.ensure_epoch()
+        cls.client = TestClient(main.app)
+
+    def test_304_until_the_user_writes(self):
+        username = f"poller-{uuid.uuid4().hex[:8]}"
+        self.assertEqual(self.client.post("/signup", json={"username": username, "password": "pw"}).status_code, 200)
+
+        first = self.client.get(f"/user/profile/{username}")
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers["etag"]
+
+        again = self.client.get(f"/user/profile/{username}", headers={"If-None-Match": etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["etag"], etag)
+
+        self.client.post(
+            "/safe-transfer",
+            json={"sender_username": username, "recipient_upi": "shop@upi", "amount": 10.0},
+            headers={"Idempotency-Key": str(uuid.uuid4())},
+        )
+        changed = self.client.get(f"/user/profile/{username}", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["etag"], etag)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import os
+import socket
+import socketserver
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_backend import RedisBackend, RedisError  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class RespStub(socketserver.ThreadingTCPServer):
+    # Just enough of Redis for RedisBackend, speaking RESP2 over a real socket
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, clock, password=None):
+        super().__init__(("127.0.0.1", 0), RespHandler)
+        self.clock = clock
+        self.password = password
+        self.values = {}      # key -> (int value, expires_at or None)
+        self.sets = {}
+        self.commands = []
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def drop_connections(self):
+        for connection in self.connections:
+            connection.shutdown(socket.SHUT_RDWR)
+
+    def live(self, key):
+        entry = self.values.get(key)
+        if entry and entry[1] is not None and entry[1] <= self.clock.time():
+            del self.values[key]
+            return None
+        return entry
+
+    def execute(self, args):
+        name, args = args[0].upper(), args[1:]
+        self.commands.append(name)
+        if name == "AUTH":
+            return "+OK" if args[0] == self.password else "-WRONGPASS invalid password"
+        if name == "SELECT":
+            return "+OK"
+        if name == "INCRBY":
+            entry = self.live(args[0])
+            value = (entry[0] if entry else 0) + int(args[1])
+            self.values[args[0]] = (value, entry[1] if entry else None)
+            return value
+        if name == "EXPIRE":
+            entry = self.live(args[0])
+            if entry is None:
+                return 0
+            self.values[args[0]] = (entry[0], self.clock.time() + int(args[1]))
+            return 1
+        if name == "MGET":
+            return [None if self.live(key) is None else str(self.live(key)[0]) for key in args]
+        if name == "SADD":
+            members = self.sets.setdefault(args[0], set())
+            added = len(set(args[1:]) - members)
+            members.update(args[1:])
+            return added
+        if name == "SREM":
+            members = self.sets.get(args[0], set())
+            removed = len(members & set(args[1:]))
+            members.difference_update(args[1:])
+            return removed
+        if name == "SISMEMBER":
+            return int(args[1] in self.sets.get(args[0], ()))
+        return f"-ERR unknown command '{name}'"
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections.append(self.connection)
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2].decode())
+            with self.server.lock:
+                reply = self.server.execute(args)
+            self.wfile.write(self.encode(reply))
+
+    @classmethod
+    def encode(cls, reply):
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(cls.encode(item) for item in reply)
+        if reply is None:
+            return b"$-1\r\n"
+        if reply[:1] in "+-":
+            return reply.encode() + b"\r\n"
+        data = reply.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class RedisBackendTest(unittest.TestCase):
+    # The client runs unchanged against a local RESP stand-in; both share a fake clock
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patch = mock.patch("state_backend.time.time", self.clock.time)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.server = self.start_server()
+
+    def start_server(self, password=None):
+        server = RespStub(self.clock, password)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def backend(self, server=None, auth="", db=""):
+        host, port = (server or self.server).server_address
+        return RedisBackend(f"redis://{auth}{host}:{port}/{db}")
+
+    def test_counters_and_ttl(self):
+        backend = self.backend()
+        self.assertEqual(backend.incr("vel:a:alice:1", 1, ttl=2), 1)
+        self.assertEqual(backend.incr("vel:a:alice:1", 2, ttl=2), 3)
+        self.assertEqual(backend.incr("ver:alice"), 1)
+        self.assertEqual(backend.get_many(["vel:a:alice:1", "ver:alice", "missing"]), [3, 1, 0])
+        self.clock.now += 3
+        self.assertEqual(backend.get_many(["vel:a:alice:1", "ver:alice"]), [0, 1])
+
+    def test_sets(self):
+        backend = self.backend()
+        backend.sadd("blacklist", "a@upi", "b@upi")
+        backend.srem("blacklist", "a@upi")
+        self.assertFalse(backend.sismember("blacklist", "a@upi"))
+        self.assertTrue(backend.sismember("blacklist", "b@upi"))
+
+    def test_auth_and_database_are_sent_on_connect(self):
+        server = self.start_server(password="secret")
+        self.backend(server, auth=":secret@", db="2").incr("k")
+        self.assertEqual(server.commands[:3], ["AUTH", "SELECT", "INCRBY"])
+        with self.assertRaises(RedisError):
+            self.backend(server, auth=":wrong@").incr("k")
+
+    def test_reconnects_after_the_connection_drops(self):
+        backend = self.backend()
+        backend.incr("k")
+        self.server.drop_connections()
+        with self.assertRaises(OSError):
+            backend.incr("k")
+        self.assertEqual(backend.incr("k"), 2)
+
+    def test_take_is_a_fixed_window(self):
+        # Documented deviation from the token bucket: at most burst per window,
+        # so up to twice the burst across a window edge
+        backend = self.backend()
+        self.clock.now = 1_700_000_000.0 - 0.01   # Just before a 2s window edge
+        before_edge = [backend.take("ip:1", 5, 10)[0] for _ in range(12)]
+        self.clock.now += 0.02
+        after_edge = [backend.take("ip:1", 5, 10)[0] for _ in range(12)]
+        self.assertEqual(before_edge.count(True), 10)
+        self.assertEqual(after_edge.count(True), 10)
+        allowed, retry_after = backend.take("ip:1", 5, 10)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 1.99, places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
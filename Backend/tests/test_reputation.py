@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+class AutoBlacklistTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        main.prepare_schema()
+
+    def setUp(self):
+        self.recipient = f"collector-{uuid.uuid4().hex[:8]}@upi"
+        saved = main.RECIPIENT_AUTO_BLACKLIST, main.RECIPIENT_AUTO_BLACKLIST_SENDERS
+        main.RECIPIENT_AUTO_BLACKLIST, main.RECIPIENT_AUTO_BLACKLIST_SENDERS = True, 2
+        self.addCleanup(setattr, main, "RECIPIENT_AUTO_BLACKLIST", saved[0])
+        self.addCleanup(setattr, main, "RECIPIENT_AUTO_BLACKLIST_SENDERS", saved[1])
+        self.published = []
+        main.event_bus.add_listener(self.published.append)
+        self.addCleanup(main.event_bus._listeners.remove, self.published.append)
+
+    def pay(self, db, sender):
+        main.add_transaction_log(db, main.TransactionLogDB(
+            idempotency_key=str(uuid.uuid4()), username=sender, recipient=self.recipient, amount=10.0,
+            type="PAYMENT", state=main.TransactionState.APPROVED, timestamp=datetime.now(timezone.utc),
+        ), record_counters=False)
+
+    def blacklist_deltas(self):
+        return sum(e["deltas"].get("blacklist", 0) for e in self.published if e["type"] == "stats")
+
+    def test_second_distinct_sender_blacklists_the_recipient(self):
+        db = main.SessionLocal()
+        try:
+            self.pay(db, "a")
+            self.pay(db, "b")
+            db.commit()
+        finally:
+            db.close()
+        self.assertTrue(main.state.sismember("blacklist", self.recipient))
+        self.assertEqual(self.blacklist_deltas(), 1)
+
+    def test_recipient_already_blocked_elsewhere_does_not_fail_the_payment(self):
+        # Committed by an admin (or another worker) before this transaction adds it
+        admin = main.SessionLocal()
+        admin.add(main.ScamListDB(upi_id=self.recipient, reason="Reported Fraud", added_on="2024-01-01"))
+        admin.commit()
+        admin.close()
+        self.published.clear()
+
+        db = main.SessionLocal()
+        try:
+            self.pay(db, "a")
+            self.pay(db, "b")
+            db.commit()
+            reason = db.query(main.ScamListDB.reason).filter(main.ScamListDB.upi_id == self.recipient).scalar()
+        finally:
+            db.close()
+        self.assertEqual(reason, "Reported Fraud")
+        self.assertEqual(self.blacklist_deltas(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
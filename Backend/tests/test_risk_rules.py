@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import manage  # noqa: E402
+from risk_rules import LazyFeatures, RuleEngine, RuleError, compile_rules  # noqa: E402
+
+FEATURE_COSTS = {"amount": 0, "aura_score": 1}
+
+
+def features(**values):
+    return LazyFeatures({name: (cost, lambda ctx, name=name: ctx[name]) for name, cost in FEATURE_COSTS.items()}, values)
+
+
+class LegacyEquivalenceTest(unittest.TestCase):
+    # manage.py verify-rules, run over the shipped risk_rules.json
+
+    def test_shipped_rules_match_the_legacy_engine(self):
+        checked, mismatches = manage.compare_with_legacy(main.risk_rules_engine.current())
+        self.assertGreater(checked, 0)
+        self.assertEqual(mismatches[:5], [])
+
+    def test_comparison_notices_a_changed_weight(self):
+        with open(main.RISK_RULES_PATH, encoding="utf-8") as f:
+            config = json.load(f)
+        config["params"]["WEIGHT_BLACKLIST"] += 1
+        ruleset = compile_rules(config, {name: cost for name, (cost, _) in main.RISK_FEATURES.items()})
+        grid = dict(manage.VERIFY_GRID, recipient_blacklisted=[True], amount=[100.0])
+        _, mismatches = manage.compare_with_legacy(ruleset, grid)
+        self.assertTrue(mismatches)
+
+
+class NegativePointsTest(unittest.TestCase):
+    def test_constant_negative_points_are_rejected_at_load(self):
+        for points in (-5, "BONUS", "min(0, BONUS)"):
+            config = {"params": {"BONUS": -10}, "rules": [{"id": "bonus", "points": points}]}
+            with self.assertRaises(RuleError):
+                compile_rules(config, FEATURE_COSTS)
+
+    def test_feature_dependent_negative_points_are_clamped(self):
+        config = {"rules": [
+            {"id": "discount", "points": "amount - 100", "message": "Discount ({points})"},
+            {"id": "low_aura", "when": "aura_score < 50", "points": 20},
+        ]}
+        ruleset = compile_rules(config, FEATURE_COSTS)
+        score, messages, fired = ruleset.evaluate(features(amount=40, aura_score=10), 100)
+        self.assertEqual(score, 20)
+        self.assertEqual(fired, ["discount", "low_aura"])
+        self.assertIn("Discount (0)", messages)
+
+    def test_reload_keeps_previous_rules_when_points_go_negative(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rules.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"rules": [{"id": "flat", "points": 5}]}, f)
+            engine = RuleEngine(path, FEATURE_COSTS, reload_seconds=0)
+
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"rules": [{"id": "flat", "points": -5}]}, f)
+            os.utime(path, ns=(0, engine._mtime + 1))
+
+            score, _, _ = engine.current().evaluate(features(amount=0, aura_score=0), 100)
+            self.assertEqual(score, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import create_engine, select
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from rollups import RollupBuffer, bucket_start, compact, query_series  # noqa: E402
+
+T0 = datetime(2026, 3, 1, 12, 0)   # Naive UTC, on an hour boundary
+EPOCH0 = (T0 - datetime(1970, 1, 1)).total_seconds()
+
+
+class RollupTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.engine = create_engine(f"sqlite:///{self.dir.name}/rollups.db")
+        self.addCleanup(self.engine.dispose)
+        self.table = main.MetricRollupDB.__table__
+        self.table.create(self.engine)
+        self.buffer = RollupBuffer()
+
+    def rows(self, resolution):
+        with self.engine.connect() as connection:
+            return {
+                (start, metric): value
+                for start, metric, value in connection.execute(
+                    select(self.table.c.bucket_start, self.table.c.metric, self.table.c.value).where(self.table.c.resolution == resolution)
+                )
+            }
+
+    def test_flushes_add_into_the_same_bucket(self):
+        self.buffer.record_log("APPROVED", "PAYMENT", 100.0, EPOCH0 + 5)
+        self.buffer.record_log("BLOCKED", "PAYMENT", 50.0, EPOCH0 + 30)
+        self.buffer.on_event({"type": "decision", "ts": EPOCH0 + 5, "risk_score": 40, "rules": ["large_amount"]})
+        self.buffer.on_event({"type": "stats", "ts": EPOCH0, "deltas": {}})
+        self.assertEqual(self.buffer.flush(self.engine, self.table), 7)
+
+        self.buffer.record_log("APPROVED", "PAYMENT", 25.0, EPOCH0 + 59)
+        self.buffer.flush(self.engine, self.table)
+        self.assertEqual(self.buffer.flush(self.engine, self.table), 0)
+
+        rows = self.rows("minute")
+        self.assertEqual(rows[(T0, "approved")], 2)
+        self.assertEqual(rows[(T0, "volume")], 125.0)
+        self.assertEqual(rows[(T0, "blocked")], 1)
+        self.assertEqual(rows[(T0, "type:PAYMENT")], 3)
+        self.assertEqual(rows[(T0, "rule:large_amount")], 1)
+        self.assertEqual(self.buffer.stats()["pending"], 0)
+
+    def test_failed_flush_keeps_increments_for_the_next_one(self):
+        self.buffer.add(EPOCH0, "approved")
+        broken = mock.Mock()
+        broken.begin.side_effect = RuntimeError("database is down")
+        with self.assertRaises(RuntimeError):
+            self.buffer.flush(broken, self.table)
+        self.buffer.add(EPOCH0, "approved")
+        self.assertEqual(self.buffer.stats()["failed_flushes"], 1)
+
+        self.buffer.flush(self.engine, self.table)
+        self.assertEqual(self.rows("minute")[(T0, "approved")], 2)
+
+    def test_compaction_folds_minutes_into_hours(self):
+        for minute in range(0, 120, 15):
+            self.buffer.add(EPOCH0 + minute * 60, "approved", 2)
+        self.buffer.flush(self.engine, self.table)
+
+        folded = compact(self.engine, self.table, "minute", "hour", T0 + timedelta(hours=1))
+        self.assertEqual(folded, 4)
+        self.assertEqual(self.rows("hour"), {(T0, "approved"): 8})
+        self.assertEqual(len(self.rows("minute")), 4)
+        self.assertEqual(compact(self.engine, self.table, "minute", "hour", T0 + timedelta(hours=1)), 0)
+
+    def test_series_fills_gaps_and_includes_finer_rows(self):
+        self.buffer.add(EPOCH0, "approved", 3)
+        self.buffer.add(EPOCH0 + 2 * 3600 + 60, "approved")
+        self.buffer.on_event({"type": "decision", "ts": EPOCH0, "risk_score": 30, "rules": ["mule_relay"]})
+        self.buffer.on_event({"type": "decision", "ts": EPOCH0 + 60, "risk_score": 10, "rules": []})
+        self.buffer.flush(self.engine, self.table)
+        compact(self.engine, self.table, "minute", "hour", T0 + timedelta(hours=1))
+
+        with self.engine.connect() as connection:
+            buckets, series, rules, types = query_series(connection, self.table, T0, T0 + timedelta(hours=3), "hour")
+        self.assertEqual(buckets, [T0, T0 + timedelta(hours=1), T0 + timedelta(hours=2)])
+        self.assertEqual(series["approved"], [3, 0, 1])
+        self.assertEqual(series["decisions"], [2, 0, 0])
+        self.assertEqual(series["mean_risk_score"], [20.0, None, None])
+        self.assertEqual(rules, {"mule_relay": [1, 0, 0]})
+        self.assertEqual(types, {})
+
+    def test_bucket_start(self):
+        self.assertEqual(bucket_start(EPOCH0 + 3599, "hour"), T0)
+        self.assertEqual(bucket_start(EPOCH0 + 61, "minute"), T0 + timedelta(minutes=1))
+        self.assertEqual(bucket_start(EPOCH0, "day"), T0.replace(hour=0))
+
+
+class TimeseriesEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        main.prepare_schema()
+        cls.client = TestClient(main.app)
+
+    def test_answers_from_rollups(self):
+        body = self.client.get("/admin/timeseries", params={"resolution": "hour"}).json()
+        self.assertEqual(body["resolution"], "hour")
+        self.assertEqual(len(body["series"]["approved"]), len(body["buckets"]))
+
+    def test_rejects_bad_ranges(self):
+        self.assertEqual(self.client.get("/admin/timeseries", params={"start": "2026-03-02T00:00:00", "end": "2026-03-01T00:00:00"}).status_code, 400)
+        self.assertEqual(self.client.get("/admin/timeseries", params={"resolution": "week"}).status_code, 400)
+        long_range = {"start": "2020-01-01T00:00:00", "end": "2026-01-01T00:00:00", "resolution": "minute"}
+        self.assertEqual(self.client.get("/admin/timeseries", params=long_range).status_code, 400)
+
+    def test_resolution_follows_range_and_age(self):
+        now = datetime.utcnow()
+        self.assertEqual(main.pick_resolution(now - timedelta(hours=2), now), "minute")
+        self.assertEqual(main.pick_resolution(now - timedelta(days=3), now), "hour")
+        self.assertEqual(main.pick_resolution(now - timedelta(days=90), now), "day")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sketches import HyperLogLog, RollingHyperLogLog, TDigest  # noqa: E402
+
+HOUR = 3600
+
+
+class HyperLogLogTest(unittest.TestCase):
+    def test_estimate_within_a_few_standard_errors(self):
+        # precision 8: standard error about 6.5%
+        for n in (10, 200, 5000):
+            sketch = HyperLogLog(8)
+            for i in range(n):
+                sketch.add(f"user{i}@upi")
+                sketch.add(f"user{i}@upi")
+            self.assertAlmostEqual(sketch.count(), n, delta=max(2, n * 0.2), msg=n)
+
+    def test_merge_is_the_union(self):
+        a, b = HyperLogLog(8), HyperLogLog(8)
+        for i in range(300):
+            a.add(i)
+        for i in range(200, 500):
+            b.add(i)
+        self.assertAlmostEqual(a.merge(b).count(), 500, delta=100)
+        with self.assertRaises(ValueError):
+            a.merge(HyperLogLog(6))
+
+
+class RollingHyperLogLogTest(unittest.TestCase):
+    def setUp(self):
+        self.start = 1_700_000_000 // (6 * HOUR) * (6 * HOUR)
+
+    def test_old_slices_age_out(self):
+        sketch = RollingHyperLogLog(precision=8, buckets=4, bucket_seconds=6 * HOUR)
+        for i in range(50):
+            sketch.add(f"old{i}", self.start)
+        for i in range(30):
+            sketch.add(f"new{i}", self.start + 20 * HOUR)
+        self.assertAlmostEqual(sketch.count(self.start + 20 * HOUR), 80, delta=8)
+        # 24h after the first slice opened it is out of the window
+        self.assertAlmostEqual(sketch.count(self.start + 24 * HOUR), 30, delta=4)
+
+    def test_extra_item_is_counted_without_being_stored(self):
+        sketch = RollingHyperLogLog()
+        sketch.add("a@upi", self.start)
+        self.assertAlmostEqual(sketch.count(self.start, extra="b@upi"), 2, delta=0.1)
+        self.assertAlmostEqual(sketch.count(self.start), 1, delta=0.1)
+
+    def test_serialized_size_is_bounded(self):
+        sketch = RollingHyperLogLog()
+        for hour in range(0, 96, 3):
+            for i in range(100):
+                sketch.add(f"{hour}-{i}", self.start + hour * HOUR)
+        data = sketch.to_bytes()
+        self.assertLessEqual(len(data), RollingHyperLogLog.HEADER.size + 4 * (4 + 256))
+
+        restored = RollingHyperLogLog.from_bytes(data)
+        now = self.start + 95 * HOUR
+        self.assertEqual(restored.count(now), sketch.count(now))
+
+    def test_changed_settings_start_over(self):
+        sketch = RollingHyperLogLog()
+        sketch.add("a@upi", self.start)
+        restored = RollingHyperLogLog.from_bytes(sketch.to_bytes(), buckets=8)
+        self.assertEqual(restored.count(self.start), 0)
+        self.assertEqual(RollingHyperLogLog.from_bytes(None).count(self.start), 0)
+
+
+class TDigestTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.values = [rng.lognormvariate(6, 1) for _ in range(20000)]
+
+    def exact(self, q):
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def test_tail_quantiles_are_accurate(self):
+        digest = TDigest(100)
+        for value in self.values:
+            digest.add(value)
+        for q in (0.5, 0.9, 0.99):
+            self.assertAlmostEqual(digest.quantile(q), self.exact(q), delta=self.exact(q) * 0.03, msg=q)
+        self.assertLessEqual(len(digest.centroids), 100)
+
+    def test_merged_digests_match_one_digest(self):
+        parts = [TDigest(100) for _ in range(4)]
+        for i, value in enumerate(self.values):
+            parts[i % 4].add(value)
+        cohort = TDigest(100)
+        for part in parts:
+            cohort.merge(part)
+        self.assertEqual(cohort.count, len(self.values))
+        self.assertAlmostEqual(cohort.quantile(0.99), self.exact(0.99), delta=self.exact(0.99) * 0.05)
+
+    def test_round_trip_keeps_quantiles_and_bounds(self):
+        digest = TDigest(100)
+        for value in self.values:
+            digest.add(value)
+        restored = TDigest.from_bytes(digest.to_bytes())
+        self.assertEqual(restored.count, digest.count)
+        self.assertEqual((restored.min, restored.max), (digest.min, digest.max))
+        self.assertAlmostEqual(restored.quantile(0.99), digest.quantile(0.99), delta=digest.quantile(0.99) * 0.001)
+        self.assertLess(len(digest.to_bytes()), TDigest.HEADER.size + 8 * 100 + 1)
+
+    def test_small_and_empty_digests(self):
+        self.assertIsNone(TDigest().quantile(0.99))
+        self.assertIsNone(TDigest.from_bytes(None).quantile(0.5))
+        digest = TDigest()
+        digest.add(250.0)
+        self.assertEqual(digest.quantile(0.99), 250.0)
+        digest.add(100.0)
+        self.assertGreaterEqual(digest.quantile(0.99), 100.0)
+        self.assertLessEqual(digest.quantile(0.99), 250.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
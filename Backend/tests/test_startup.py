@@ -0,0 +1,86 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+
+def fresh_startup():
+    return mock.patch.dict(main.STARTUP, {"ready": False, "phases": {}, "warmup": {}, "failed": []})
+
+
+class ReadinessTest(unittest.TestCase):
+    # STARTUP is module state; every test works on a fresh copy of it
+
+    def setUp(self):
+        patch = fresh_startup()
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.client = TestClient(main.app)
+
+    def test_live_but_not_ready_before_warmup(self):
+        self.assertEqual(self.client.get("/healthz").status_code, 200)
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["ready"])
+        self.assertEqual(response.json()["pending"], sorted(main.WARMUP_TASKS))
+
+    def test_ready_once_every_task_has_run(self):
+        ran = []
+        tasks = {"first": lambda: ran.append("first"), "second": lambda: ran.append("second")}
+        with mock.patch.dict(main.WARMUP_TASKS, tasks, clear=True):
+            asyncio.run(main.run_warmup())
+            response = self.client.get("/readyz")
+        self.assertEqual(sorted(ran), ["first", "second"])
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["pending"], body["failed"]), ([], []))
+        self.assertEqual(sorted(body["warmup_seconds"]), ["first", "second"])
+        self.assertIn("warmup", body["phases_seconds"])
+
+    def test_failed_task_keeps_the_worker_out_of_rotation(self):
+        def broken():
+            raise RuntimeError("cold cache")
+
+        with mock.patch.dict(main.WARMUP_TASKS, {"ok": lambda: None, "broken": broken}, clear=True):
+            with self.assertLogs("guardpay", "ERROR"):
+                asyncio.run(main.run_warmup())
+            response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["failed"], ["broken"])
+        self.assertEqual(response.json()["pending"], [])
+
+    def test_tasks_run_in_parallel(self):
+        tasks = {f"slow{i}": (lambda: time.sleep(0.2)) for i in range(3)}
+        with mock.patch.dict(main.WARMUP_TASKS, tasks, clear=True):
+            started = time.monotonic()
+            asyncio.run(main.run_warmup())
+        self.assertLess(time.monotonic() - started, 0.5)
+
+
+class LifespanTest(unittest.TestCase):
+    def setUp(self):
+        patch = fresh_startup()
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_real_warmup_tasks_become_ready(self):
+        with TestClient(main.app) as client:
+            deadline = time.monotonic() + 30
+            while client.get("/readyz").status_code != 200 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            body = client.get("/readyz").json()
+        self.assertTrue(body["ready"], body)
+        self.assertEqual(sorted(body["warmup_seconds"]), sorted(main.WARMUP_TASKS))
+        self.assertIn("schema", body["phases_seconds"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_backend import SharedMemoryBackend, StateBackendFull  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class SharedMemoryChurnTest(unittest.TestCase):
+    # A local file stands in for /dev/shm; the clock is faked so TTLs expire on demand
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        patches = [
+            mock.patch("state_backend.time.time", self.clock.time),
+            mock.patch("state_backend.time.monotonic", self.clock.monotonic),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def backend(self, slots):
+        return SharedMemoryBackend(os.path.join(self.dir.name, "state"), slots)
+
+    def empty_slots(self, backend):
+        start = backend.HEADER.size
+        end = backend._offset(backend.slots)
+        return sum(1 for slot_hash, _, _ in backend.SLOT.iter_unpack(backend._mm[start:end]) if slot_hash == backend.EMPTY)
+
+    def test_ttl_churn_keeps_empty_slots(self):
+        backend = self.backend(4096)
+        members = []
+        for round_no in range(40):
+            for user in range(400):
+                backend.incr(f"vel:a:user{user}:{int(self.clock.now)}", 1, ttl=2)
+            for client in range(10):
+                backend.take(f"ip:10.0.{round_no}.{client}", 5, 10)
+            new = [f"id{round_no}-{i}@upi" for i in range(25)]
+            backend.sadd("blacklist", *new)
+            members.extend(new)
+            self.clock.now += 3
+
+            # Dead slots are reclaimed: at most one round of inserts above the load limit
+            self.assertGreater(self.empty_slots(backend), backend.slots * (1 - backend.MAX_LOAD) - 600)
+
+        self.assertTrue(all(backend.sismember("blacklist", m) for m in members))
+        self.assertEqual(backend.get_many([f"vel:a:user{u}:0" for u in range(122)]), [0] * 122)
+        self.assertEqual(backend.stats()["failed_compactions"], 0)
+
+    def test_expired_entries_are_not_read_back(self):
+        backend = self.backend(256)
+        backend.incr("short", 5, ttl=1)
+        backend.incr("long", 7)
+        self.clock.now += 2
+        self.assertEqual(backend.get_many(["short", "long"]), [0, 7])
+
+    def test_deleted_tail_returns_to_empty(self):
+        backend = self.backend(256)
+        backend.sadd("blacklist", "a", "b", "c")
+        before = self.empty_slots(backend)
+        for member in ("a", "b", "c"):
+            backend.srem("blacklist", member)
+            backend.sismember("blacklist", member)
+        self.assertEqual(self.empty_slots(backend), before + 3)
+        self.assertEqual(backend.stats()["used"], 0)
+
+    def test_full_table_raises_instead_of_scanning(self):
+        backend = self.backend(64)
+        with self.assertRaises(StateBackendFull):
+            for i in range(65):
+                backend.sadd("blacklist", f"member{i}")
+        self.assertTrue(backend.sismember("blacklist", "member0"))
+
+    def test_rehash_never_drops_members_without_ttl(self):
+        # Lookup-valid layout (home slot -> slots): 6 -> 6, 6 -> 7, 7 -> 0. A rehash
+        # in slot order puts the wrapped entry at 7 first, and with two probes
+        # the second entry homed at 6 has nowhere to go
+        backend = self.backend(8)
+        backend.MAX_PROBE = 2
+        for slot, home in ((6, 6), (7, 6), (0, 7)):
+            backend.SLOT.pack_into(backend._mm, backend._offset(slot), 8 * (slot + 1) + home, 1, 0.0)
+        backend._set_used(3)
+        start, end = backend.HEADER.size, backend._offset(backend.slots)
+        before = backend._mm[start:end]
+
+        self.assertFalse(backend._compact(self.clock.now))
+        self.assertEqual(backend._mm[start:end], before)
+        self.assertEqual(backend.stats()["failed_compactions"], 1)
+
+    def test_older_layout_is_reinitialised(self):
+        path = os.path.join(self.dir.name, "state")
+        with open(path, "wb") as f:
+            f.write(b"GPSTATE1" + (64).to_bytes(8, "little") + b"\xff" * 64 * 24)
+        backend = SharedMemoryBackend(path, 128)
+        self.assertEqual(backend.slots, 128)
+        self.assertEqual(backend.get("anything"), 0)
+        self.assertEqual(self.empty_slots(backend), 128)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_state import UserState, UserStateCache  # noqa: E402
+
+
+def entry(username, version, **changes):
+    values = dict(
+        aura_score=600, is_blocked=False, created_at=None, safe_transaction_count=0,
+        warning_count=0, avg_tx_amount=0.0, std_dev_amount=0.0, total_tx_count=0,
+    )
+    values.update(changes)
+    return UserState(username, version=version, **values)
+
+
+class UserStateExpiryTest(unittest.TestCase):
+    # Versions only cover writers on the same state backend; the TTL bounds the rest
+
+    def setUp(self):
+        self.now = 100.0
+        patch = mock.patch("user_state.time.monotonic", lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.cache = UserStateCache(1 << 20, ttl=10)
+
+    def test_entry_expires_after_ttl_even_if_version_matches(self):
+        self.cache.put(entry("alice", 1))
+        self.now += 9
+        self.assertIsNotNone(self.cache.get("alice", 1))
+        self.now += 2
+        self.assertIsNone(self.cache.get("alice", 1))
+        self.assertEqual(self.cache.stats()["expired"], 1)
+
+    def test_write_through_keeps_original_read_time(self):
+        self.cache.put(entry("alice", 1))
+        self.now += 8
+        self.cache.write_through("alice", 1, 2, is_blocked=True)
+        self.assertTrue(self.cache.get("alice", 2).is_blocked)
+        self.now += 3
+        self.assertIsNone(self.cache.get("alice", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
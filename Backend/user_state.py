@@ -0,0 +1,140 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Per-worker cache of the user fields the write paths read on every request
+# (trust, block flag, age, fingerprint), so a transfer does not need to load a
+# UserDB row first.
+#
+# Entries are small __slots__ objects and are never mutated once cached; a
+# change replaces the entry. Each one remembers the user's read version
+# (read_cache.VersionStamps) it was loaded at. Every write path on every worker
+# bumps that version, so a lookup with a newer version is a miss and reloads
+# the row. A writer that knows nobody else wrote in between (its bump moved
+# the version by exactly one) writes its new values through instead of
+# dropping the entry.
+#
+# The versions only cover writers that share the state backend, so entries
+# also expire ttl seconds after their row was read (a write-through keeps the
+# original read time). With a per-process backend and several workers the
+# cache must be off; main.py does that at startup.
+
+# Dict slot plus LRU links per key, on top of the entry and its values
+_KEY_OVERHEAD = 104
+
+
+class UserState:
+    __slots__ = (
+        "username", "aura_score", "is_blocked", "created_at", "safe_transaction_count",
+        "warning_count", "avg_tx_amount", "std_dev_amount", "total_tx_count", "version", "loaded_at",
+    )
+
+    def __init__(self, username, aura_score, is_blocked, created_at, safe_transaction_count,
+                 warning_count, avg_tx_amount, std_dev_amount, total_tx_count, version, loaded_at=None):
+        self.username = username
+        self.aura_score = aura_score
+        self.is_blocked = is_blocked
+        self.created_at = created_at
+        self.safe_transaction_count = safe_transaction_count
+        self.warning_count = warning_count
+        self.avg_tx_amount = avg_tx_amount
+        self.std_dev_amount = std_dev_amount
+        self.total_tx_count = total_tx_count
+        self.version = version
+        self.loaded_at = time.monotonic() if loaded_at is None else loaded_at
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return UserState(**values)
+
+    def nbytes(self):
+        return sys.getsizeof(self) + _KEY_OVERHEAD + sum(
+            sys.getsizeof(getattr(self, name)) for name in self.__slots__ if name != "is_blocked"
+        )
+
+
+class UserStateCache:
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.evictions = 0
+        self.write_throughs = 0
+
+    def get(self, username, version):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.version != version:
+                self.stale += 1
+                self._remove(username)
+                return None
+            if time.monotonic() - entry.loaded_at > self.ttl:
+                self.expired += 1
+                self._remove(username)
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry
+
+    def put(self, entry):
+        with self._lock:
+            self._insert(entry)
+
+    def write_through(self, username, expected_version, new_version, **changes):
+        # Only when this writer's own bump is the sole change since the entry
+        # was read; otherwise the next lookup reloads the row
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return
+            if expected_version is None or entry.version != expected_version or new_version != expected_version + 1:
+                self._remove(username)
+                return
+            self._insert(entry.replace(version=new_version, **changes))
+            self.write_throughs += 1
+
+    def discard(self, username):
+        with self._lock:
+            self._remove(username)
+
+    def _insert(self, entry):
+        if self.max_bytes <= 0:
+            return
+        self._remove(entry.username)
+        self._entries[entry.username] = entry
+        self.bytes += entry.nbytes()
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, username):
+        entry = self._entries.pop(username, None)
+        if entry is not None:
+            self.bytes -= entry.nbytes()
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.stale + self.expired
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "write_throughs": self.write_throughs,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
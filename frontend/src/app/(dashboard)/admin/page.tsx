@@ -25,8 +25,40 @@ interface Metrics {
   active_blacklist_entries: number
 }
 
+// Raw totals from /admin/stream: a "snapshot" sets them, "stats" events add deltas
+interface Totals {
+  users: number
+  blocked: number
+  approved: number
+  approved_volume: number
+  aura_total: number
+  blacklist: number
+}
+
+interface Decision {
+  id: number
+  status: "APPROVED" | "BLOCKED"
+  username: string
+  recipient: string
+  amount: number
+  risk_score: number
+  rules: string[]
+  latency_ms: number
+}
+
+const MAX_DECISIONS = 20
+
+const toMetrics = (totals: Totals): Metrics => ({
+  total_registered_users: totals.users,
+  fraud_attempts_blocked: totals.blocked,
+  total_safe_volume_processed: `₹${totals.approved_volume}`,
+  system_trust_average: `${totals.users ? Math.round((totals.aura_total / totals.users) * 100) / 100 : 0}%`,
+  active_blacklist_entries: totals.blacklist,
+})
+
 export default function AdminPage() {
-  const [metrics, setMetrics] = useState<Metrics | null>(null)
+  const [totals, setTotals] = useState<Totals | null>(null)
+  const [decisions, setDecisions] = useState<Decision[]>([])
   const [upiId, setUpiId] = useState("")
   const [reason, setReason] = useState("")
 
@@ -49,9 +81,6 @@ export default function AdminPage() {
       setUpiId("")
       setReason("")
 
-      const res = await api.get("/admin/global-stats")
-      setMetrics(res.data.metrics)
-
     } catch (error) {
       toast.error("Failed to blacklist ID")
     }
@@ -59,19 +88,39 @@ export default function AdminPage() {
 
 
   useEffect(() => {
-    const fetchStats = async () => {
-      try {
-        const res = await api.get("/admin/global-stats")
-        setMetrics(res.data.metrics)
-      } catch (error) {
-        console.error("Failed to fetch admin stats:", error)
-      }
+    // Live updates instead of polling; EventSource reconnects on its own and
+    // every (re)connect starts with a fresh snapshot
+    const source = new EventSource(`${api.defaults.baseURL}/admin/stream`)
+
+    source.addEventListener("snapshot", (e) => {
+      setTotals(JSON.parse((e as MessageEvent).data))
+    })
+
+    source.addEventListener("stats", (e) => {
+      const { deltas } = JSON.parse((e as MessageEvent).data)
+      setTotals((current) => {
+        if (!current) return current
+        const next = { ...current }
+        for (const [key, value] of Object.entries(deltas as Record<string, number>)) {
+          next[key as keyof Totals] = (next[key as keyof Totals] ?? 0) + value
+        }
+        return next
+      })
+    })
+
+    source.addEventListener("decision", (e) => {
+      const decision = JSON.parse((e as MessageEvent).data) as Decision
+      setDecisions((current) => [decision, ...current].slice(0, MAX_DECISIONS))
+    })
+
+    source.onerror = () => {
+      console.error("Admin stream disconnected, retrying...")
     }
 
-    fetchStats()
+    return () => source.close()
   }, [])
 
-  if (!metrics) {
+  if (!totals) {
     return (
       <div className="text-slate-400">
         Loading Admin Dashboard...
@@ -79,6 +128,8 @@ export default function AdminPage() {
     )
   }
 
+  const metrics = toMetrics(totals)
+
   return (
     <div className="space-y-8">
 
@@ -164,11 +215,7 @@ export default function AdminPage() {
             data={[
                 {
                     name: "Approved",
-                    value: Math.max(
-                        metrics.total_registered_users * 2 -
-                            metrics.fraud_attempts_blocked,
-                        0
-                    ),
+                    value: totals.approved,
                 },
                 {
                     name: "Blocked",
@@ -185,6 +232,36 @@ export default function AdminPage() {
         </ResponsiveContainer>
     </div>
 
+    <div className="bg-slate-900/60 border border-slate-800 rounded-xl p-6">
+      <h3 className="text-lg font-semibold text-slate-200 mb-4">
+        Live Risk Decisions
+      </h3>
+
+      {decisions.length === 0 ? (
+        <p className="text-slate-500 text-sm">Waiting for transfers...</p>
+      ) : (
+        <div className="space-y-2">
+          {decisions.map((d) => (
+            <div
+              key={d.id}
+              className="flex items-center justify-between text-sm border-b border-slate-800 pb-2"
+            >
+              <span className={d.status === "BLOCKED" ? "text-red-400" : "text-emerald-400"}>
+                {d.status}
+              </span>
+              <span className="text-slate-300">
+                {d.username} → {d.recipient} · ₹{d.amount}
+              </span>
+              <span className="text-slate-400">
+                risk {d.risk_score}{d.rules.length > 0 && ` (${d.rules.join(", ")})`}
+              </span>
+              <span className="text-slate-500">{d.latency_ms} ms</span>
+            </div>
+          ))}
+        </div>
+      )}
+    </div>
+
     <div className="bg-slate-900/60 border border-slate-800 rounded-xl p-6 space-y-4">
       <h3 className="text-lg font-semibold text-slate-200">
         Blacklist Control